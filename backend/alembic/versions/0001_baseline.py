@@ -0,0 +1,105 @@
+"""baseline: таблицы в том виде, в каком их создавал Base.metadata.create_all
+
+Существующие базы уже содержат эти таблицы, поэтому создаются только отсутствующие:
+`alembic upgrade head` одинаково работает на пустой и на уже развернутой базе.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _create_contacts():
+    op.create_table(
+        "contacts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("phone", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_contacts_id", "contacts", ["id"])
+
+
+def _create_messages():
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("contact_id", sa.Integer(), nullable=True),
+        sa.Column("session_id", sa.String(), nullable=True),
+        sa.Column("message", sa.Text()),
+        sa.Column("response", sa.Text()),
+        sa.Column("is_from_user", sa.Integer()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_messages_id", "messages", ["id"])
+    op.create_index("ix_messages_session_id", "messages", ["session_id"])
+
+
+def _create_documents():
+    op.create_table(
+        "documents",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("file_type", sa.String(), nullable=True),
+        sa.Column("file_size", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_documents_id", "documents", ["id"])
+
+
+def _create_session_summaries():
+    op.create_table(
+        "session_summaries",
+        sa.Column("session_id", sa.String(), primary_key=True),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("last_message_id", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+
+def _create_crm_outbox():
+    op.create_table(
+        "crm_outbox",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("dedup_key", sa.String(), nullable=False, unique=True),
+        sa.Column("contact_id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("lead_id", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_crm_outbox_id", "crm_outbox", ["id"])
+    op.create_index("ix_crm_outbox_status", "crm_outbox", ["status"])
+
+
+TABLES = {
+    "contacts": _create_contacts,
+    "messages": _create_messages,
+    "documents": _create_documents,
+    "session_summaries": _create_session_summaries,
+    "crm_outbox": _create_crm_outbox,
+}
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for table, create in TABLES.items():
+        if table not in existing:
+            create()
+
+
+def downgrade():
+    for table in reversed(list(TABLES)):
+        op.drop_table(table)
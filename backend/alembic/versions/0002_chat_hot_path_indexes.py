@@ -0,0 +1,78 @@
+"""индексы для горячих запросов чата и внешний ключ messages.contact_id
+
+- messages (session_id, id): история сессии - session_id = ? AND id > ? ORDER BY id DESC LIMIT n.
+  История упорядочивается по id (сообщения одного хода имеют одинаковый created_at),
+  поэтому составной индекс по (session_id, id), а не по (session_id, created_at).
+  Заменяет одиночный ix_messages_session_id.
+- messages (contact_id, created_at): сообщения контакта в админке.
+- messages (session_id) WHERE contact_id IS NULL: привязка сообщений сессии к новому контакту.
+- messages (created_at), contacts (created_at), documents (created_at): списки в админке.
+- contacts (phone): поиск существующего контакта по телефону.
+- crm_outbox (status, next_attempt_at): выборка готовых задач воркером outbox.
+  Заменяет одиночный ix_crm_outbox_status.
+
+Индексы строятся CONCURRENTLY, чтобы не блокировать запись в рабочей базе.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_messages_session_id_id", "messages", ["session_id", "id"], None),
+    ("ix_messages_contact_id_created_at", "messages", ["contact_id", "created_at"], None),
+    ("ix_messages_session_id_unlinked", "messages", ["session_id"], "contact_id IS NULL"),
+    ("ix_messages_created_at", "messages", ["created_at"], None),
+    ("ix_contacts_phone", "contacts", ["phone"], None),
+    ("ix_contacts_created_at", "contacts", ["created_at"], None),
+    ("ix_documents_created_at", "documents", ["created_at"], None),
+    ("ix_crm_outbox_status_next_attempt_at", "crm_outbox", ["status", "next_attempt_at"], None),
+]
+
+REPLACED_INDEXES = [
+    ("ix_messages_session_id", "messages", ["session_id"]),
+    ("ix_crm_outbox_status", "crm_outbox", ["status"]),
+]
+
+
+def upgrade():
+    # Сообщения могли ссылаться на удаленные контакты - иначе внешний ключ не создать
+    op.execute(
+        "UPDATE messages SET contact_id = NULL "
+        "WHERE contact_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM contacts WHERE contacts.id = messages.contact_id)"
+    )
+    # NOT VALID + VALIDATE: проверка существующих строк без долгой блокировки записи.
+    # ADD CONSTRAINT берет короткую блокировку и фиксируется вместе с транзакцией миграции,
+    # VALIDATE (SHARE UPDATE EXCLUSIVE, запись не блокирует) выполняется уже вне ее
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_contact_id_fkey "
+        "FOREIGN KEY (contact_id) REFERENCES contacts (id) ON DELETE SET NULL NOT VALID"
+    )
+
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE messages VALIDATE CONSTRAINT messages_contact_id_fkey")
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+                if_not_exists=True,
+            )
+        for name, table, _ in REPLACED_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in REPLACED_INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    op.drop_constraint("messages_contact_id_fkey", "messages", type_="foreignkey")
@@ -0,0 +1,52 @@
+"""messages: одна строка на обмен репликами вместо двух строк с дублированным текстом
+
+Раньше ход сохранялся двумя строками: строка пользователя (is_from_user = 1) и строка
+бота (is_from_user = 0), в которую повторно копировался текст пользователя. Строка бота
+уже содержит весь обмен, поэтому строка пользователя удаляется, если сразу за ней
+в той же сессии идет строка бота с тем же текстом. Строки пользователя без ответа
+остаются обменом с response = NULL. Колонка is_from_user удаляется.
+
+Ссылки session_summaries.last_message_id остаются корректными: строка бота идет
+после строки пользователя, поэтому обмен, свернутый в резюме лишь наполовину,
+снова попадает в историю целиком.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        DELETE FROM messages u
+        USING messages b
+        WHERE u.is_from_user = 1
+          AND b.is_from_user = 0
+          AND b.session_id = u.session_id
+          AND b.message IS NOT DISTINCT FROM u.message
+          AND b.id = (
+              SELECT min(m.id) FROM messages m
+              WHERE m.session_id = u.session_id AND m.id > u.id
+          )
+        """
+    )
+    op.drop_column("messages", "is_from_user")
+
+
+def downgrade():
+    # Строки пользователя восстанавливаются с новыми id (после строки бота своего хода)
+    op.add_column("messages", sa.Column("is_from_user", sa.Integer(), nullable=True))
+    op.execute("UPDATE messages SET is_from_user = CASE WHEN response IS NULL THEN 1 ELSE 0 END")
+    op.execute(
+        "INSERT INTO messages (contact_id, session_id, message, response, is_from_user, created_at) "
+        "SELECT contact_id, session_id, message, NULL, 1, created_at FROM messages "
+        "WHERE is_from_user = 0 ORDER BY id"
+    )
@@ -0,0 +1,32 @@
+"""knowledge_base_state: версия базы знаний, общая для всех воркеров
+
+Каждый воркер хранил версию базы знаний в памяти, поэтому загрузка документа
+через один воркер не сбрасывала кэш ответов, кэш переранжирования и лексический
+индекс остальных. Версия увеличивается в этой таблице при каждом изменении базы
+знаний, а воркеры сверяются с ней не реже KB_VERSION_REFRESH_INTERVAL секунд.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "knowledge_base_state",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.execute("INSERT INTO knowledge_base_state (id, version) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table("knowledge_base_state")
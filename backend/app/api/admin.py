@@ -1,7 +1,18 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.request_timing import list_profiles, profile_path
 from app.db.database import get_db
-from app.models.db_models import Contact, Message
+from app.models.db_models import Contact, CrmOutbox, Message
+from app.services.admission import chat_admission
+from app.services.knowledge_service import knowledge_service
+from app.services.openai_governor import openai_governor
+from app.services.outbox_service import outbox_service
+from app.services.response_cache import response_cache
+from app.services.session_lock import inflight_turns, session_lock
+from app.services.session_state import session_state_store
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -20,28 +31,108 @@ class ContactResponse(BaseModel):
 class MessageResponse(BaseModel):
     id: int
     contact_id: Optional[int] = None
+    session_id: Optional[str] = None
     message: str
     response: Optional[str] = None
-    is_from_user: int
     created_at: datetime
     
     class Config:
         from_attributes = True
 
+class OutboxJobResponse(BaseModel):
+    id: int
+    contact_id: int
+    session_id: Optional[str] = None
+    status: str
+    attempts: int
+    next_attempt_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    lead_id: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 @router.get("/contacts", response_model=List[ContactResponse])
-async def get_contacts(db: Session = Depends(get_db)):
+async def get_contacts(db: AsyncSession = Depends(get_db)):
     """Получить список всех контактов"""
-    contacts = db.query(Contact).order_by(Contact.created_at.desc()).all()
-    return contacts
+    result = await db.execute(select(Contact).order_by(Contact.created_at.desc()))
+    return result.scalars().all()
 
 @router.get("/contacts/{contact_id}/messages", response_model=List[MessageResponse])
-async def get_contact_messages(contact_id: int, db: Session = Depends(get_db)):
+async def get_contact_messages(contact_id: int, db: AsyncSession = Depends(get_db)):
     """Получить историю сообщений контакта"""
-    messages = db.query(Message).filter(Message.contact_id == contact_id).order_by(Message.created_at).all()
-    return messages
+    result = await db.execute(
+        select(Message).where(Message.contact_id == contact_id).order_by(Message.created_at)
+    )
+    return result.scalars().all()
 
 @router.get("/messages", response_model=List[MessageResponse])
-async def get_all_messages(db: Session = Depends(get_db), limit: int = 100):
+async def get_all_messages(db: AsyncSession = Depends(get_db), limit: int = 100):
     """Получить все сообщения"""
-    messages = db.query(Message).order_by(Message.created_at.desc()).limit(limit).all()
-    return messages
+    result = await db.execute(select(Message).order_by(Message.created_at.desc()).limit(limit))
+    return result.scalars().all()
+
+@router.get("/response-cache")
+async def get_response_cache_stats():
+    """Статистика семантического кэша ответов"""
+    return response_cache.stats()
+
+@router.get("/metrics")
+async def get_metrics():
+    """Сводка нагрузки воркера: admission control, очередь OpenAI, блокировки сессий и кэши"""
+    return {
+        "admission": chat_admission.stats(),
+        "openai": openai_governor.stats(),
+        "session_locks": session_lock.stats(),
+        "coalescing": inflight_turns.stats(),
+        "session_state_cache": session_state_store.stats(),
+        "query_embedding_cache": knowledge_service.query_embedding_cache_stats(),
+        "response_cache": response_cache.stats(),
+    }
+
+@router.get("/openai")
+async def get_openai_governor_stats():
+    """Очередь и ограничение запросов к OpenAI (RPM/TPM, конкурентность, 429)"""
+    return openai_governor.stats()
+
+@router.get("/sessions/locks")
+async def get_session_lock_stats():
+    """Очередность ходов сессий и объединение повторных запросов"""
+    return {"locks": session_lock.stats(), "coalescing": inflight_turns.stats()}
+
+@router.get("/outbox/stats")
+async def get_outbox_stats(db: AsyncSession = Depends(get_db)):
+    """Количество задач отправки лидов в Bitrix24 по статусам"""
+    return await outbox_service.get_stats(db)
+
+@router.get("/outbox", response_model=List[OutboxJobResponse])
+async def get_outbox_jobs(db: AsyncSession = Depends(get_db), status: Optional[str] = None, limit: int = 100):
+    """Получить задачи отправки лидов в Bitrix24"""
+    query = select(CrmOutbox).order_by(CrmOutbox.id.desc()).limit(limit)
+    if status:
+        query = query.where(CrmOutbox.status == status)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+@router.get("/outbox/{job_id}", response_model=OutboxJobResponse)
+async def get_outbox_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Статус задачи отправки лида"""
+    job = await db.get(CrmOutbox, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+@router.get("/profiles")
+async def get_profiles():
+    """Сохраненные профили запросов (X-Profile / ?profile=)"""
+    return list_profiles()
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str):
+    """HTML-отчет pyinstrument"""
+    path = profile_path(name)
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="text/html", filename=name)
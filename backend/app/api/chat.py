@@ -1,17 +1,50 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.schemas import ChatRequest, ChatResponse
-from app.services.ai_service import ai_service
-from app.services.bitrix24_service import bitrix24_service
+from app.services.admission import AdmissionRejected, chat_admission
+from app.services.ai_service import ERROR_RESPONSE_TEXT, ai_service
+from app.services.history_service import history_service
+from app.services.outbox_service import outbox_service
+from app.services.response_cache import response_cache
+from app.services.session_lock import SessionBusyError, inflight_turns, session_lock
+from app.services.session_state import ContactSnapshot, SessionState
 from app.db.database import get_db
 from app.models.db_models import Contact, Message
+from app.core.config import settings
+from app.core.metrics import CHAT_STAGE_SECONDS, CONTACT_UPSERT_SECONDS, record_error
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.singleflight import FlightAborted
+from app.utils.timing import StageTimings, current_timings
+from typing import Optional
+import asyncio
+import json
 import re
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
+SESSION_BUSY_TEXT = "Предыдущее сообщение еще обрабатывается, попробуйте чуть позже."
+DEADLINE_EXCEEDED_TEXT = "Извините, не удалось обработать сообщение вовремя. Попробуйте еще раз."
+OVERLOADED_TEXT = "Сервис перегружен, повторите запрос позже."
+
+async def chat_admission_slot():
+    """Слот admission control на все время запроса, включая поток SSE"""
+    try:
+        service_started = await chat_admission.acquire()
+    except AdmissionRejected as e:
+        record_error("admission", e)
+        logger.warning(f"Запрос чата отклонен ({e.reason}), Retry-After: {e.retry_after} с")
+        raise HTTPException(status_code=503, detail=OVERLOADED_TEXT, headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    finally:
+        chat_admission.release(service_started)
+
 def extract_contact_info(text: str) -> dict:
     """Извлечение контактной информации из текста"""
     contact = {}
@@ -99,58 +132,46 @@ def extract_contact_info(text: str) -> dict:
     
     return contact
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
-    import uuid
-    
-    # Генерируем session_id если не передан
-    session_id = request.session_id or str(uuid.uuid4())
+def is_contact_complete(contact: Optional[ContactSnapshot]) -> bool:
+    """Собраны ли у контакта и имя, и телефон"""
+    return bool(contact and contact.name and contact.phone)
+
+def is_cacheable_turn(contact: Optional[ContactSnapshot]) -> bool:
+    """
+    Можно ли брать ответ хода из семантического кэша и сохранять в него
     
-    # СНАЧАЛА получаем историю сообщений для извлечения контактов из всего разговора
-    previous_messages = db.query(Message).filter(Message.session_id == session_id).order_by(Message.created_at).all()
-    
-    # Ищем существующий контакт по session_id из предыдущих сообщений
-    contact = None
-    if previous_messages:
-        # Ищем контакт из предыдущих сообщений этой сессии
-        for msg in previous_messages:
-            if msg.contact_id:
-                contact = db.query(Contact).filter(Contact.id == msg.contact_id).first()
-                if contact:
-                    break
+    Только когда контакты собраны: ответ не просит данных и не зависит от них.
+    """
+    return response_cache.enabled and is_contact_complete(contact)
+
+def contact_values(contact: Optional[ContactSnapshot]) -> tuple:
+    """Персональные данные контакта, которые не должны попасть в общий кэш ответов"""
+    if not contact:
+        return ()
+    return tuple(value for value in (contact.name, contact.phone) if value)
+
+def build_contact_status(contact: Optional[ContactSnapshot], include_values: bool = True) -> str:
+    """
+    Информация о собранных контактах для промпта
     
-    # СНАЧАЛА получаем ответ от ИИ, чтобы использовать данные из него (приоритет #1)
-    # Формируем историю разговора для ИИ (из previous_messages)
-    conversation_history_for_ai = []
-    for msg in previous_messages:
-        if msg.is_from_user:
-            conversation_history_for_ai.append({
-                "role": "user",
-                "content": msg.message
-            })
-        else:
-            conversation_history_for_ai.append({
-                "role": "assistant",
-                "content": msg.response or ""
-            })
-    
-    # Формируем информацию о собранных контактах для промпта
-    contact_status_for_ai = ""
-    if contact:
-        has_name = bool(contact.name)
-        has_phone = bool(contact.phone)
-        if has_name and has_phone:
-            contact_status_for_ai = f"\n\nВАЖНО: Контакты клиента УЖЕ СОБРАНЫ:\n- Имя: {contact.name}\n- Телефон: {contact.phone}\nНЕ ПРОСИ эти данные снова! Просто помогай по вопросам."
-        elif has_name:
-            contact_status_for_ai = f"\n\nВАЖНО: Имя клиента уже известно: {contact.name}. Нужно собрать только номер телефона."
-        elif has_phone:
-            contact_status_for_ai = f"\n\nВАЖНО: Телефон клиента уже известен: {contact.phone}. Нужно собрать только имя."
-    
-    # Получаем ответ от AI с учетом истории и статуса контактов
-    # ВАЖНО: делаем это ДО создания/обновления контакта, чтобы использовать данные из ответа ИИ
-    response_text, ai_extracted_name, ai_extracted_phone = await ai_service.get_response(request.message, conversation_history_for_ai, contact_status_for_ai)
-    
-    # Инициализируем contact_info ТОЛЬКО данными от ИИ (приоритет #1, без проверок)
+    include_values=False - без имени и телефона: ответ уйдет в общий кэш и может достаться другому посетителю.
+    """
+    if not contact:
+        return ""
+    has_name = bool(contact.name)
+    has_phone = bool(contact.phone)
+    if has_name and has_phone and not include_values:
+        return "\n\nВАЖНО: Контакты клиента (имя и телефон) УЖЕ СОБРАНЫ. НЕ ПРОСИ эти данные снова и не называй их в ответе! Просто помогай по вопросам."
+    if has_name and has_phone:
+        return f"\n\nВАЖНО: Контакты клиента УЖЕ СОБРАНЫ:\n- Имя: {contact.name}\n- Телефон: {contact.phone}\nНЕ ПРОСИ эти данные снова! Просто помогай по вопросам."
+    elif has_name:
+        return f"\n\nВАЖНО: Имя клиента уже известно: {contact.name}. Нужно собрать только номер телефона."
+    elif has_phone:
+        return f"\n\nВАЖНО: Телефон клиента уже известен: {contact.phone}. Нужно собрать только имя."
+    return ""
+
+def normalize_ai_contact_info(ai_extracted_name: str, ai_extracted_phone: str) -> dict:
+    """Нормализация имени и телефона, извлеченных ИИ (приоритет #1, без проверок)"""
     contact_info = {}
     
     # Если ИИ извлек имя из ответа, используем его БЕЗ проверок (ИИ сам решает)
@@ -175,165 +196,324 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             contact_info['phone'] = phone_digits
             logger.info(f"Телефон извлечен ИИ: {contact_info['phone']}")
     
-    # Если ИИ не нашел данные - ничего не делаем, он найдет позже
+    return contact_info
+
+async def upsert_contact(db: AsyncSession, known_contact: Optional[ContactSnapshot], contact_info: dict) -> tuple[Optional[Contact], bool]:
+    """
+    Создание или дополнение контакта данными от ИИ
+    
+    Returns:
+        tuple: (contact, should_send_to_bitrix) - созданный/измененный контакт
+            (None, если в БД ничего не менялось) и флаг, что контакт только что
+            стал полным (есть и имя, и телефон)
+    """
+    if not contact_info:
+        return None, False
+    
+    # Контакт сессии уже содержит все переданные поля - обращаться к БД не нужно
+    if known_contact and all(getattr(known_contact, key) for key in contact_info):
+        return None, False
+    
+    contact = await db.get(Contact, known_contact.id) if known_contact else None
+    
+    # Ищем существующий контакт по телефону, если в сессии контакта еще нет
+    if not contact and contact_info.get('phone'):
+        result = await db.execute(select(Contact).where(Contact.phone == contact_info['phone']).limit(1))
+        contact = result.scalars().first()
+    
+    # Создаем новый контакт если не найден
+    if not contact:
+        contact = Contact(**contact_info)
+        db.add(contact)
+        await db.commit()
+        await db.refresh(contact)
+        # Отправляем в Bitrix24 если есть оба поля
+        return contact, bool(contact.name and contact.phone)
+    
+    # Проверяем, были ли у контакта имя и телефон до обновления
+    had_both_before = bool(contact.name and contact.phone)
     
-    # Если нашли контакт из сессии, обновляем его данными
     contact_was_updated = False
-    should_send_to_bitrix = False
-    
-    if contact:
-        if contact_info:
-            # Проверяем, были ли у контакта имя и телефон до обновления
-            had_both_before = bool(contact.name and contact.phone)
-            
-            for key, value in contact_info.items():
-                if value and not getattr(contact, key):
-                    setattr(contact, key, value)
-                    contact_was_updated = True
-            
-            if contact_was_updated:
-                db.commit()
-                db.refresh(contact)
-                # Отправляем в Bitrix24 только если теперь есть оба поля, а раньше не было
-                if not had_both_before and contact.name and contact.phone:
-                    should_send_to_bitrix = True
-    elif contact_info:
-        # Ищем существующий контакт по телефону
-        if contact_info.get('phone'):
-            contact = db.query(Contact).filter(Contact.phone == contact_info['phone']).first()
-        
-        # Создаем новый контакт если не найден
-        if not contact:
-            contact = Contact(**contact_info)
-            db.add(contact)
-            db.commit()
-            db.refresh(contact)
+    for key, value in contact_info.items():
+        if value and not getattr(contact, key):
+            setattr(contact, key, value)
             contact_was_updated = True
-            # Отправляем в Bitrix24 если есть оба поля
-            if contact.name and contact.phone:
-                should_send_to_bitrix = True
-        else:
-            # Проверяем, были ли у контакта имя и телефон до обновления
-            had_both_before = bool(contact.name and contact.phone)
-            
-            # Обновляем существующий контакт
-            for key, value in contact_info.items():
-                if value and not getattr(contact, key):
-                    setattr(contact, key, value)
-                    contact_was_updated = True
-            
-            if contact_was_updated:
-                db.commit()
-                db.refresh(contact)
-                # Отправляем в Bitrix24 только если теперь есть оба поля, а раньше не было
-                if not had_both_before and contact.name and contact.phone:
-                    should_send_to_bitrix = True
-    
-    # Отправляем контакт в Bitrix24, если нужно
-    if should_send_to_bitrix and contact and contact.name and contact.phone:
-        try:
-            # Генерируем краткое резюме диалога для CRM
-            # Формируем историю из предыдущих сообщений для резюме
-            summary_history = []
-            for msg in previous_messages:
-                if msg.is_from_user:
-                    summary_history.append({
-                        "role": "user",
-                        "content": msg.message
-                    })
-                else:
-                    summary_history.append({
-                        "role": "assistant",
-                        "content": msg.response or ""
-                    })
-            # Добавляем текущее сообщение
-            summary_history.append({
-                "role": "user",
-                "content": request.message
-            })
-            conversation_summary = await ai_service.generate_conversation_summary(summary_history)
-            
-            # Формируем комментарий для Bitrix24
-            if conversation_summary:
-                comments = f"Краткое резюме диалога:\n{conversation_summary}\n\nSession ID: {session_id}"
-            else:
-                # Если резюме нет (диалог только начался), просто указываем Session ID
-                comments = f"Контакт создан из AI Chat Widget. Session ID: {session_id}"
-            
-            result = await bitrix24_service.create_lead(
-                name=contact.name,
-                phone=contact.phone,
-                comments=comments
-            )
-            if result.get("success"):
-                logger.info(f"Контакт {contact.name} ({contact.phone}) успешно отправлен в Bitrix24 (Lead ID: {result.get('lead_id')})")
-            else:
-                logger.warning(f"Не удалось отправить контакт в Bitrix24: {result.get('error')}")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке контакта в Bitrix24: {str(e)}", exc_info=True)
-    
-    # Если есть контакт, обновляем все сообщения этой сессии на этот контакт
-    if contact:
-        db.query(Message).filter(Message.session_id == session_id, Message.contact_id == None).update(
-            {"contact_id": contact.id}
+    
+    if not contact_was_updated:
+        # Контакт найден по телефону, но не менялся - его все равно нужно привязать к сессии
+        return (None if known_contact else contact), False
+    
+    await db.commit()
+    await db.refresh(contact)
+    # Отправляем в Bitrix24 только если теперь есть оба поля, а раньше не было
+    return contact, bool(not had_both_before and contact.name and contact.phone)
+
+async def load_session_context(db: AsyncSession, session_id: str) -> tuple[SessionState, list]:
+    """Загрузка состояния сессии (контакт, история) из кэша или БД"""
+    state = await history_service.get_session_state(db, session_id)
+    
+    # История для ИИ: резюме старой части диалога + свежие сообщения в пределах бюджета токенов
+    conversation_history = history_service.build(session_id, state.messages, state.summary)
+    return state, conversation_history
+
+async def finalize_turn(
+    db: AsyncSession,
+    session_id: str,
+    state: SessionState,
+    message: str,
+    response_text: str,
+    ai_extracted_name: str,
+    ai_extracted_phone: str
+):
+    """Обновление контакта, отправка лида и сохранение сообщений по итогам ответа ИИ"""
+    # Создаем/обновляем контакт ТОЛЬКО данными от ИИ (если ИИ не нашел данные - он найдет позже)
+    contact_info = normalize_ai_contact_info(ai_extracted_name, ai_extracted_phone)
+    with CONTACT_UPSERT_SECONDS.time():
+        contact, should_send_to_bitrix = await upsert_contact(db, state.contact, contact_info)
+    contact_id = contact.id if contact else (state.contact.id if state.contact else None)
+    
+    # Контакт только что стал полным - ставим лид в очередь Bitrix24 (резюме и отправка идут в фоне)
+    if should_send_to_bitrix:
+        await outbox_service.enqueue_lead(db, contact.id, session_id)
+    
+    # Контакт только что появился у сессии - привязываем к нему предыдущие сообщения
+    if contact_id and not state.contact:
+        await db.execute(
+            update(Message)
+            .where(Message.session_id == session_id, Message.contact_id == None)
+            .values(contact_id=contact_id)
         )
-        db.commit()
-    
-    # Получаем историю сообщений для контекста
-    conversation_history = []
-    if contact:
-        # Берем последние 50 сообщений этого контакта
-        messages = db.query(Message).filter(Message.contact_id == contact.id).order_by(Message.created_at).limit(50).all()
-    else:
-        # Если контакта нет, берем сообщения по session_id
-        messages = db.query(Message).filter(Message.session_id == session_id).order_by(Message.created_at).limit(50).all()
-    
-    # Формируем историю разговора (ВАЖНО: исключаем текущее сообщение, оно еще не сохранено)
-    for msg in messages:
-        if msg.is_from_user:
-            conversation_history.append({
-                "role": "user",
-                "content": msg.message
-            })
-        else:
-            conversation_history.append({
-                "role": "assistant",
-                "content": msg.response or ""
-            })
-    
-    # Формируем информацию о собранных контактах для промпта
-    contact_status = ""
-    if contact:
-        has_name = bool(contact.name)
-        has_phone = bool(contact.phone)
-        if has_name and has_phone:
-            contact_status = f"\n\nВАЖНО: Контакты клиента УЖЕ СОБРАНЫ:\n- Имя: {contact.name}\n- Телефон: {contact.phone}\nНЕ ПРОСИ эти данные снова! Просто помогай по вопросам."
-        elif has_name:
-            contact_status = f"\n\nВАЖНО: Имя клиента уже известно: {contact.name}. Нужно собрать только номер телефона."
-        elif has_phone:
-            contact_status = f"\n\nВАЖНО: Телефон клиента уже известен: {contact.phone}. Нужно собрать только имя."
-    
-    # Получаем ответ от AI с учетом истории и статуса контактов
-    # ВАЖНО: это второй вызов для сохранения ответа в БД, но данные из ИИ уже использованы выше
-    response_text, _, _ = await ai_service.get_response(request.message, conversation_history, contact_status)
-    
-    # Сохраняем сообщения в БД с session_id
-    user_message = Message(
-        contact_id=contact.id if contact else None,
+    
+    # Сохраняем обмен репликами (вопрос и ответ) одной строкой с session_id
+    exchange = Message(
+        contact_id=contact_id,
         session_id=session_id,
-        message=request.message,
-        is_from_user=1
+        message=message,
+        response=response_text
     )
-    db.add(user_message)
+    db.add(exchange)
+    await db.commit()
     
-    bot_message = Message(
-        contact_id=contact.id if contact else None,
-        session_id=session_id,
-        message=request.message,
-        response=response_text,
-        is_from_user=0
+    if should_send_to_bitrix:
+        outbox_service.notify()
+    
+    # Write-through: следующий ход сессии не обращается к БД за историей и контактом
+    await history_service.record_turn(session_id, state, contact, [exchange])
+
+def request_deadline(x_request_timeout: Optional[str]) -> Deadline:
+    """Дедлайн хода: из заголовка X-Request-Timeout (секунды) или chat_request_timeout"""
+    return Deadline.from_header(
+        x_request_timeout,
+        default=settings.chat_request_timeout,
+        maximum=settings.chat_request_timeout_max
     )
-    db.add(bot_message)
-    db.commit()
+
+async def retrieve_within_limit(message: str) -> list:
+    """Поиск по базе знаний не дольше chat_retrieval_timeout; дольше - ответ без базы знаний"""
+    try:
+        return await asyncio.wait_for(
+            ai_service.retrieve_knowledge(message),
+            timeout=settings.chat_retrieval_timeout
+        )
+    except asyncio.TimeoutError as e:
+        record_error("retrieval", e)
+        logger.warning(f"Поиск по базе знаний дольше {settings.chat_retrieval_timeout} с, ответ без базы знаний")
+        return []
+
+def start_retrieval(message: str, timings: StageTimings) -> asyncio.Task:
+    """
+    Запустить поиск по базе знаний (эмбеддинг + Qdrant) фоновой задачей
+    
+    Поиск зависит только от текста сообщения, поэтому идет параллельно
+    с ожиданием очереди сессии и загрузкой истории и контакта из БД.
+    """
+    return asyncio.create_task(timings.measure("retrieval", retrieve_within_limit(message)))
+
+async def await_retrieval(retrieval: asyncio.Task, deadline: Deadline) -> list:
+    """Результаты поиска, если они не забирают у ИИ время chat_llm_min_budget; иначе - без базы знаний"""
+    try:
+        return await deadline.run(retrieval, reserve=settings.chat_llm_min_budget)
+    except DeadlineExceeded as e:
+        record_error("retrieval", e)
+        logger.warning("Поиск по базе знаний не уложился в бюджет хода, ответ без базы знаний")
+        return []
+
+# Стадии хода в гистограмме chat_stage_seconds (вложенные замеры сервисов - в своих метриках)
+TURN_STAGES = ("history", "retrieval", "llm", "finalize")
+
+def record_turn_timings(session_id: str, timings: StageTimings):
+    """Лог и гистограммы стадий хода"""
+    for stage in TURN_STAGES:
+        if stage in timings.stages:
+            CHAT_STAGE_SECONDS.labels(stage=stage).observe(timings.stages[stage] / 1000)
+    CHAT_STAGE_SECONDS.labels(stage="total").observe(timings.total_ms() / 1000)
+    logger.info(f"Стадии хода {session_id}: {timings.summary()}")
+
+def format_sse(event: str, data: dict) -> str:
+    """Форматирование события Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat", response_model=ChatResponse, dependencies=[Depends(chat_admission_slot)])
+async def chat(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    x_request_timeout: Optional[str] = Header(None)
+):
+    # Генерируем session_id если не передан
+    session_id = request.session_id or str(uuid.uuid4())
+    deadline = request_deadline(x_request_timeout)
+    
+    turn_key = (session_id, request.message)
+    while (pending := inflight_turns.get(turn_key)) is not None:
+        # Такой же запрос уже обрабатывается - ждем его ответ, ход не сохраняется повторно
+        try:
+            response_text = await deadline.run(inflight_turns.wait(pending))
+            return ChatResponse(response=response_text, session_id=session_id)
+        except FlightAborted:
+            continue  # Исходный запрос прерван - выполняем ход сами
+        except SessionBusyError:
+            raise HTTPException(status_code=409, detail=SESSION_BUSY_TEXT)
+        except DeadlineExceeded:
+            raise HTTPException(status_code=504, detail=DEADLINE_EXCEEDED_TEXT)
     
+    timings = current_timings()
+    retrieval = start_retrieval(request.message, timings)
+    try:
+        with inflight_turns.lead(turn_key) as turn:
+            # Ходы одной сессии выполняются по очереди: контакт, лид и история видят результат предыдущего хода
+            async with session_lock.hold(session_id, timeout=deadline.budget()):
+                state, conversation_history = await timings.measure(
+                    "history", deadline.run(load_session_context(db, session_id))
+                )
+                search_results = await await_retrieval(retrieval, deadline)
+                cacheable = is_cacheable_turn(state.contact)
+                
+                # Единственный вызов ИИ за ход: ответ клиенту и извлеченные имя/телефон
+                response_text, ai_extracted_name, ai_extracted_phone = await timings.measure(
+                    "llm", ai_service.get_response(
+                        request.message, conversation_history,
+                        build_contact_status(state.contact, include_values=not cacheable),
+                        use_response_cache=cacheable,
+                        private_values=contact_values(state.contact),
+                        search_results=search_results,
+                        deadline=deadline.shrink(settings.chat_finalize_reserve)
+                    )
+                )
+                
+                # Сохранение хода не ограничивается дедлайном: ответ уже получен и должен попасть в историю
+                await timings.measure("finalize", finalize_turn(
+                    db, session_id, state, request.message,
+                    response_text, ai_extracted_name, ai_extracted_phone
+                ))
+            turn.set_result(response_text)
+    except SessionBusyError as e:
+        record_error("chat", e)
+        raise HTTPException(status_code=409, detail=SESSION_BUSY_TEXT)
+    except DeadlineExceeded as e:
+        record_error("chat", e)
+        raise HTTPException(status_code=504, detail=DEADLINE_EXCEEDED_TEXT)
+    finally:
+        retrieval.cancel()
+    
+    record_turn_timings(session_id, timings)
     return ChatResponse(response=response_text, session_id=session_id)
+
+@router.post("/chat/stream", dependencies=[Depends(chat_admission_slot)])
+async def chat_stream(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    x_request_timeout: Optional[str] = Header(None)
+):
+    """
+    Потоковый ответ бота (Server-Sent Events)
+    
+    События:
+        session - {"session_id": "..."} сразу после начала
+        token - {"text": "..."} очередной кусок ответа
+        done - {"response": "...", "session_id": "...", "server_timing": "..."} полный ответ после
+            сохранения в БД; server_timing - стадии хода в формате заголовка Server-Timing
+    """
+    # Генерируем session_id если не передан
+    session_id = request.session_id or str(uuid.uuid4())
+    deadline = request_deadline(x_request_timeout)
+    turn_key = (session_id, request.message)
+    
+    async def event_stream():
+        yield format_sse("session", {"session_id": session_id})
+        
+        while (pending := inflight_turns.get(turn_key)) is not None:
+            # Повторная отправка того же сообщения - отдаем ответ исходного запроса целиком
+            try:
+                response_text = await deadline.run(inflight_turns.wait(pending))
+            except (FlightAborted, SessionBusyError):
+                # Исходный запрос прерван или не дождался очереди сессии - выполняем ход сами
+                continue
+            except DeadlineExceeded:
+                response_text = DEADLINE_EXCEEDED_TEXT
+            except Exception as e:
+                # Исходный запрос завершился ошибкой - отдаем ее, как /api/chat, без повторного хода
+                record_error("chat", e)
+                response_text = ERROR_RESPONSE_TEXT
+            yield format_sse("done", {"response": response_text, "session_id": session_id})
+            return
+        
+        timings = current_timings()
+        retrieval = start_retrieval(request.message, timings)
+        with inflight_turns.lead(turn_key) as turn:
+            try:
+                async with session_lock.hold(session_id, timeout=deadline.budget()):
+                    # Состояние читается под блокировкой, чтобы учесть предыдущий ход сессии
+                    state, conversation_history = await timings.measure(
+                        "history", deadline.run(load_session_context(db, session_id))
+                    )
+                    search_results = await await_retrieval(retrieval, deadline)
+                    cacheable = is_cacheable_turn(state.contact)
+                    
+                    result = None
+                    with timings.stage("llm"):
+                        async for event, payload in ai_service.stream_response(
+                            request.message, conversation_history,
+                            build_contact_status(state.contact, include_values=not cacheable),
+                            use_response_cache=cacheable,
+                            private_values=contact_values(state.contact),
+                            search_results=search_results,
+                            deadline=deadline.shrink(settings.chat_finalize_reserve)
+                        ):
+                            if event == "delta":
+                                yield format_sse("token", {"text": payload})
+                            else:
+                                result = payload
+                    
+                    # Имя/телефон известны только после конца генерации; сохранение не ограничено дедлайном
+                    response_text, ai_extracted_name, ai_extracted_phone = result
+                    await timings.measure("finalize", finalize_turn(
+                        db, session_id, state, request.message,
+                        response_text, ai_extracted_name, ai_extracted_phone
+                    ))
+            except SessionBusyError as e:
+                record_error("chat", e)
+                response_text = SESSION_BUSY_TEXT
+                # Ожидающие этот же ход получают занятость сессии как ошибку (409), а не как ответ бота
+                turn.set_exception(e)
+            except DeadlineExceeded as e:
+                record_error("chat", e)
+                response_text = DEADLINE_EXCEEDED_TEXT
+            finally:
+                retrieval.cancel()
+            if not turn.done():
+                turn.set_result(response_text)
+        record_turn_timings(session_id, timings)
+        yield format_sse("done", {
+            "response": response_text,
+            "session_id": session_id,
+            "server_timing": timings.server_timing()
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Отключаем буферизацию nginx
+        }
+    )
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import get_db
 from app.models.db_models import Document
 from app.services.knowledge_service import knowledge_service
+from app.services.reranker import reranker
+from app.utils.text_extraction import extract_text
+from app.utils.timing import request_stage
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -26,15 +30,30 @@ class DocumentResponse(BaseModel):
         from_attributes = True
 
 @router.get("", response_model=List[DocumentResponse])
-async def get_documents(db: Session = Depends(get_db)):
+async def get_documents(db: AsyncSession = Depends(get_db)):
     """Получить список всех документов"""
-    documents = db.query(Document).order_by(Document.created_at.desc()).all()
-    return documents
+    result = await db.execute(select(Document).order_by(Document.created_at.desc()))
+    return result.scalars().all()
+
+@router.get("/cache")
+async def get_cache_stats():
+    """Статистика кэша эмбеддингов запросов"""
+    return knowledge_service.query_embedding_cache_stats()
+
+@router.get("/lexical-index")
+async def get_lexical_index_stats():
+    """Состояние лексического индекса BM25 гибридного поиска"""
+    return knowledge_service.lexical_index_stats()
+
+@router.get("/rerank")
+async def get_rerank_stats():
+    """Переранжирование cross-encoder: модель, кэш, превышения таймаута"""
+    return reranker.stats()
 
 @router.post("/upload")
 async def upload_documents(
     files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Загрузить документы в базу знаний"""
     uploaded_docs = []
@@ -51,52 +70,7 @@ async def upload_documents(
                 f.write(content)
             
             # Читаем текст из файла
-            text = ""
-            if file_ext.lower() == '.txt':
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        text = f.read()
-                except UnicodeDecodeError:
-                    with open(file_path, "r", encoding="windows-1251") as f:
-                        text = f.read()
-            elif file_ext.lower() == '.pdf':
-                try:
-                    from pypdf import PdfReader
-                    reader = PdfReader(file_path)
-                    text = "\n".join([page.extract_text() for page in reader.pages])
-                except Exception as e:
-                    text = f"Не удалось извлечь текст из PDF: {file.filename} - {str(e)}"
-            elif file_ext.lower() in ['.doc', '.docx']:
-                try:
-                    # Проверяем, что файл существует
-                    if not os.path.exists(file_path):
-                        raise FileNotFoundError(f"Файл не найден: {file_path}")
-                    
-                    # Импортируем Document из python-docx с переименованием, чтобы избежать конфликта
-                    # с SQLAlchemy моделью Document из app.models.db_models
-                    from docx import Document as DocxDocument
-                    # Открываем файл напрямую по пути
-                    doc = DocxDocument(file_path)
-                    paragraphs = []
-                    for paragraph in doc.paragraphs:
-                        if paragraph.text.strip():
-                            paragraphs.append(paragraph.text)
-                    # Также извлекаем текст из таблиц
-                    for table in doc.tables:
-                        for row in table.rows:
-                            for cell in row.cells:
-                                if cell.text.strip():
-                                    paragraphs.append(cell.text)
-                    text = "\n".join(paragraphs)
-                    if not text.strip():
-                        text = f"Документ {file.filename} не содержит текста"
-                except Exception as e:
-                    import traceback
-                    error_details = traceback.format_exc()
-                    print(f"DOCX error for {file.filename}: {error_details}")
-                    text = f"Не удалось извлечь текст из DOC/DOCX: {file.filename} - {str(e)}"
-            else:
-                text = f"Формат {file_ext} пока не поддерживается"
+            text = extract_text(file_path, file.filename)
             
             # Создаем запись в БД
             document = Document(
@@ -106,40 +80,43 @@ async def upload_documents(
                 file_size=len(content)
             )
             db.add(document)
-            db.commit()
-            db.refresh(document)
+            with request_stage("db"):
+                await db.commit()
+                await db.refresh(document)
             
-            # Добавляем в векторную БД
+            # Добавляем в векторную БД (внутри замеряются стадии embed и qdrant)
             if text:
-                knowledge_service.add_document(
-                    text=text,
-                    document_id=document.id,
-                    metadata={"name": file.filename, "type": file_ext}
-                )
+                with request_stage("index"):
+                    await knowledge_service.add_document(
+                        text=text,
+                        document_id=document.id,
+                        metadata={"name": file.filename, "type": file_ext}
+                    )
             
             uploaded_docs.append(document)
         except Exception as e:
             print(f"Error uploading file {file.filename}: {e}")
+            await db.rollback()
             continue
     
     return {"message": f"Загружено документов: {len(uploaded_docs)}", "documents": uploaded_docs}
 
 @router.delete("/{document_id}")
-async def delete_document(document_id: int, db: Session = Depends(get_db)):
+async def delete_document(document_id: int, db: AsyncSession = Depends(get_db)):
     """Удалить документ"""
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = await db.get(Document, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Документ не найден")
     
     # Удаляем из векторной БД
-    knowledge_service.delete_document(document_id)
+    await knowledge_service.delete_document(document_id)
     
     # Удаляем файл
     if os.path.exists(document.file_path):
         os.remove(document.file_path)
     
     # Удаляем из БД
-    db.delete(document)
-    db.commit()
+    await db.delete(document)
+    await db.commit()
     
     return {"message": "Документ удален"}
@@ -0,0 +1,137 @@
+"""
+Метрики Prometheus.
+
+Гистограммы и счетчики обновляются в местах вызова. Состояние очередей и кэшей
+(глубина, попадания) читается из сервисов в момент запроса /metrics.
+При нескольких воркерах gunicorn задайте PROMETHEUS_MULTIPROC_DIR: гистограммы и
+счетчики суммируются по воркерам, а снимки очередей и кэшей - того воркера, что ответил.
+"""
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Границы для стадий хода: от миллисекунд (кэш, БД) до десятков секунд (ИИ)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Длительность стадий хода чата", ["stage"], buckets=LATENCY_BUCKETS
+)
+HISTORY_DB_SECONDS = Histogram(
+    "history_db_load_seconds", "Загрузка истории и контакта сессии из БД (промах кэша)", buckets=LATENCY_BUCKETS
+)
+EMBEDDING_SECONDS = Histogram(
+    "embedding_seconds", "Кодирование эмбеддингов (включая ожидание пула)", ["kind"], buckets=LATENCY_BUCKETS
+)
+QDRANT_SECONDS = Histogram(
+    "qdrant_request_seconds", "Запросы к Qdrant", ["operation"], buckets=LATENCY_BUCKETS
+)
+LLM_TTFT_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds", "Время до первого куска ответа ИИ (потоковый режим)", buckets=LATENCY_BUCKETS
+)
+LLM_SECONDS = Histogram(
+    "llm_request_seconds", "Запрос chat completions целиком (с очередью лимитов и повторами)", ["mode"], buckets=LATENCY_BUCKETS
+)
+CONTACT_UPSERT_SECONDS = Histogram(
+    "contact_upsert_seconds", "Создание/дополнение контакта", buckets=LATENCY_BUCKETS
+)
+BITRIX_SECONDS = Histogram(
+    "bitrix_push_seconds", "Создание лида в Bitrix24", buckets=LATENCY_BUCKETS
+)
+RERANK_SECONDS = Histogram(
+    "rerank_seconds", "Переранжирование кандидатов cross-encoder (включая ожидание пула)", buckets=LATENCY_BUCKETS
+)
+RETRIEVAL_RESULTS = Histogram(
+    "retrieval_results", "Фрагментов базы знаний в ответе поиска", buckets=(0, 1, 2, 3, 5, 10, 20)
+)
+
+LLM_TOKENS = Counter("llm_tokens_total", "Токены OpenAI по usage ответов", ["type"])
+ERRORS = Counter("errors_total", "Ошибки по стадиям и типам", ["stage", "type"])
+
+def record_error(stage: str, error: BaseException):
+    ERRORS.labels(stage=stage, type=type(error).__name__).inc()
+
+def record_usage(usage: dict):
+    """Учесть usage ответа OpenAI (prompt_tokens / completion_tokens)"""
+    if not usage:
+        return
+    LLM_TOKENS.labels(type="prompt").inc(usage.get("prompt_tokens") or 0)
+    LLM_TOKENS.labels(type="completion").inc(usage.get("completion_tokens") or 0)
+
+class ServiceStatsCollector:
+    """Снимок очередей и кэшей сервисов на момент запроса /metrics"""
+
+    def describe(self):
+        # Без describe реестр вызывает collect при регистрации, то есть при импорте модуля,
+        # а collect импортирует сервисы, которые сами импортируют этот модуль
+        return []
+
+    def collect(self):
+        # Импорт здесь: сервисы импортируют этот модуль для своих метрик
+        from app.services.admission import chat_admission
+        from app.services.knowledge_service import knowledge_service
+        from app.services.openai_governor import openai_governor
+        from app.services.reranker import reranker
+        from app.services.response_cache import response_cache
+        from app.services.session_lock import inflight_turns, session_lock
+        from app.services.session_state import session_state_store
+
+        admission = chat_admission.stats()
+        governor = openai_governor.stats()
+
+        queue_depth = GaugeMetricFamily("queue_depth", "Запросов в очереди", labels=["queue"])
+        queue_depth.add_metric(["chat_admission"], admission["queue_depth"])
+        queue_depth.add_metric(["openai"], governor["queue_depth"])
+        yield queue_depth
+
+        in_flight = GaugeMetricFamily("in_flight", "Запросов в обработке", labels=["queue"])
+        in_flight.add_metric(["chat_admission"], admission["in_flight"])
+        in_flight.add_metric(["openai"], governor["in_flight"])
+        yield in_flight
+
+        shed = CounterMetricFamily("chat_shed", "Запросы чата, отклоненные admission control", labels=["reason"])
+        shed.add_metric(["queue_full"], admission["shed_queue_full"])
+        shed.add_metric(["queue_timeout"], admission["shed_timeout"])
+        yield shed
+
+        throttle = CounterMetricFamily("openai_throttle", "Регулятор запросов к OpenAI", labels=["event"])
+        for event in ("throttled", "rejected", "rate_limited", "retries"):
+            throttle.add_metric([event], governor[event])
+        yield throttle
+
+        locks = session_lock.stats()
+        session_waits = CounterMetricFamily("session_lock", "Ожидание очереди сессии", labels=["event"])
+        session_waits.add_metric(["waits"], locks["waits"])
+        session_waits.add_metric(["timeouts"], locks["timeouts"])
+        session_waits.add_metric(["coalesced"], inflight_turns.stats()["shared"])
+        yield session_waits
+
+        cache_hits = CounterMetricFamily("cache_hits", "Попадания в кэши", labels=["cache"])
+        cache_misses = CounterMetricFamily("cache_misses", "Промахи кэшей", labels=["cache"])
+        cache_size = GaugeMetricFamily("cache_entries", "Записей в кэше", labels=["cache"])
+        caches = {
+            "query_embedding": knowledge_service.query_embedding_cache_stats(),
+            "response": response_cache.stats(),
+            "rerank": reranker.stats(),
+            "session_state": session_state_store.stats(),
+        }
+        for name, stats in caches.items():
+            if not stats:
+                continue
+            cache_hits.add_metric([name], stats["hits"])
+            cache_misses.add_metric([name], stats["misses"])
+            cache_size.add_metric([name], stats["size"])
+        yield cache_hits
+        yield cache_misses
+        yield cache_size
+
+REGISTRY.register(ServiceStatsCollector())
+
+def render_metrics() -> tuple[bytes, str]:
+    """Текст метрик в формате Prometheus и его content type"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(ServiceStatsCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,131 @@
+"""
+Server-Timing и профилирование отдельных запросов.
+
+Каждый ответ /api получает заголовок Server-Timing со стадиями, замеренными
+до отправки заголовков (StageTimings текущего запроса). Для потоковых ответов
+заголовок уходит до генерации, поэтому полные замеры хода передаются в событии done.
+
+Запрос с заголовком X-Profile или параметром ?profile=, равным PROFILING_TOKEN,
+выполняется под pyinstrument; HTML-отчет сохраняется в PROFILING_DIR и доступен
+через /api/admin/profiles. Остальные запросы профилировщик не затрагивает.
+"""
+import logging
+import os
+import re
+import time
+import uuid
+from typing import Optional
+from urllib.parse import parse_qs
+from app.core.config import settings
+from app.utils.timing import start_request_timings
+
+logger = logging.getLogger(__name__)
+
+PROFILING_DIR = settings.profiling_dir or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "profiles"
+)
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.html$")
+
+def profile_path(name: str) -> Optional[str]:
+    """Путь к сохраненному отчету (None для недопустимого имени)"""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    return os.path.join(PROFILING_DIR, name)
+
+def list_profiles() -> list[dict]:
+    """Сохраненные отчеты, новые первыми"""
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILING_DIR):
+        path = profile_path(name)
+        if path is None:
+            continue
+        stat = os.stat(path)
+        profiles.append({"name": name, "size": stat.st_size, "created_at": stat.st_mtime})
+    return sorted(profiles, key=lambda item: item["created_at"], reverse=True)
+
+def _prune_profiles():
+    """Оставить не больше profiling_max_files последних отчетов"""
+    for item in list_profiles()[settings.profiling_max_files:]:
+        try:
+            os.remove(os.path.join(PROFILING_DIR, item["name"]))
+        except OSError:
+            pass
+
+def _profile_requested(scope) -> bool:
+    token = settings.profiling_token
+    if not token:
+        return False
+    for key, value in scope["headers"]:
+        if key == b"x-profile":
+            return value.decode("latin-1") == token
+    query = scope.get("query_string", b"")
+    if b"profile=" not in query:
+        return False
+    return parse_qs(query.decode("latin-1")).get("profile", [None])[0] == token
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware (не BaseHTTPMiddleware, чтобы не буферизовать потоковые ответы)
+    """
+
+    def __init__(self, app, path_prefix: str = "/api"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        timings = start_request_timings()
+        profiler = None
+        profile_name = None
+        if _profile_requested(scope):
+            profiler, profile_name = self._start_profiler(scope)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                if profile_name:
+                    headers.append((b"x-profile-url", f"/api/admin/profiles/{profile_name}".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if profiler is not None:
+                self._save_profile(profiler, profile_name)
+
+    @staticmethod
+    def _start_profiler(scope):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("Профилирование запрошено, но pyinstrument не установлен")
+            return None, None
+        slug = re.sub(r"[^\w]+", "-", scope["path"]).strip("-")
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}.html"
+        try:
+            profiler = Profiler(interval=settings.profiling_interval, async_mode="enabled")
+            profiler.start()
+        except RuntimeError as e:
+            # pyinstrument не допускает второй профилировщик в том же потоке/контексте
+            logger.warning(f"Профилирование запроса пропущено: {e}")
+            return None, None
+        return profiler, name
+
+    @staticmethod
+    def _save_profile(profiler, name: str):
+        try:
+            profiler.stop()
+            os.makedirs(PROFILING_DIR, exist_ok=True)
+            with open(os.path.join(PROFILING_DIR, name), "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            _prune_profiles()
+            logger.info(f"Профиль запроса сохранен: {name}")
+        except Exception as e:
+            logger.error(f"Не удалось сохранить профиль запроса: {e}", exc_info=True)
@@ -1,15 +1,19 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 from app.api import chat, admin, admin_ui, knowledge
-from app.db.database import engine, Base
+from app.core.metrics import render_metrics
+from app.core.request_timing import ServerTimingMiddleware
+from app.db.database import engine
+from app.services.ai_service import ai_service
+from app.services.knowledge_service import knowledge_service
+from app.services.outbox_service import outbox_service
+from app.services.reranker import reranker
 import os
 
-# Создаем таблицы при запуске
-Base.metadata.create_all(bind=engine)
-
 # Определяем путь для загрузок (локально или в Docker)
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -117,10 +121,24 @@ class SwaggerDarkThemeMiddleware(BaseHTTPMiddleware):
                 return HTMLResponse(content=html, status_code=response.status_code)
         return response
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схема БД создается миграциями (alembic upgrade head) до запуска приложения
+    await ai_service.startup()
+    await knowledge_service.startup()
+    await outbox_service.start()
+    yield
+    await outbox_service.stop()
+    await ai_service.shutdown()
+    await knowledge_service.shutdown()
+    reranker.shutdown()
+    await engine.dispose()
+
 # Монтируем директорию для загрузки файлов
 app = FastAPI(
     title="AI Chat Assistant API",
     version="1.0.0",
+    lifespan=lifespan,
     swagger_ui_parameters={
         "syntaxHighlight.theme": "agate",
         "persistAuthorization": True,
@@ -131,12 +149,16 @@ app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 # Добавляем middleware для тёмной темы Swagger UI
 app.add_middleware(SwaggerDarkThemeMiddleware)
 
+# Server-Timing для ответов /api и профилирование по запросу
+app.add_middleware(ServerTimingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "Server-Timing", "X-Profile-Url"],  # Виджет читает паузу перед повтором при 503
 )
 
 app.include_router(chat.router)
@@ -151,3 +173,9 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в формате Prometheus"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import BigInteger, Column, Integer, String, Text, DateTime, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from app.db.database import Base
 
@@ -10,16 +10,32 @@ class Contact(Base):
     phone = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    __table_args__ = (
+        Index("ix_contacts_phone", "phone"),  # Поиск контакта по телефону
+        Index("ix_contacts_created_at", "created_at"),  # Список контактов в админке
+    )
+    
 class Message(Base):
+    """Один обмен репликами: сообщение пользователя и ответ бота в одной строке"""
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    contact_id = Column(Integer, nullable=True)
-    session_id = Column(String, nullable=True, index=True)  # Для связывания сообщений одного пользователя
-    message = Column(Text)
-    response = Column(Text)
-    is_from_user = Column(Integer, default=1)  # 1 - от пользователя, 0 - от бота
+    contact_id = Column(Integer, ForeignKey("contacts.id", ondelete="SET NULL"), nullable=True)
+    session_id = Column(String, nullable=True)  # Для связывания сообщений одного пользователя
+    message = Column(Text)  # Сообщение пользователя
+    response = Column(Text, nullable=True)  # Ответ бота
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        # История сессии: session_id = ? AND id > ? ORDER BY id DESC
+        Index("ix_messages_session_id_id", "session_id", "id"),
+        # История контакта в админке
+        Index("ix_messages_contact_id_created_at", "contact_id", "created_at"),
+        # Привязка к контакту сообщений сессии, у которых его еще нет
+        Index("ix_messages_session_id_unlinked", "session_id", postgresql_where=text("contact_id IS NULL")),
+        # Последние сообщения в админке
+        Index("ix_messages_created_at", "created_at"),
+    )
 
 class Document(Base):
     __tablename__ = "documents"
@@ -30,3 +46,43 @@ class Document(Base):
     file_type = Column(String, nullable=True)
     file_size = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_documents_created_at", "created_at"),
+    )
+
+class SessionSummary(Base):
+    __tablename__ = "session_summaries"
+    
+    session_id = Column(String, primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    last_message_id = Column(Integer, nullable=False, default=0)  # Последнее сообщение, вошедшее в резюме
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class KnowledgeBaseState(Base):
+    """Версия базы знаний, общая для всех воркеров (одна строка с id = 1)"""
+    __tablename__ = "knowledge_base_state"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)  # Увеличивается при каждом добавлении/удалении документа
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class CrmOutbox(Base):
+    __tablename__ = "crm_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dedup_key = Column(String, nullable=False, unique=True)  # Защита от повторной отправки одного лида
+    contact_id = Column(Integer, nullable=False)
+    session_id = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="pending")  # pending / processing / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())  # Для processing - конец аренды
+    last_error = Column(Text, nullable=True)
+    lead_id = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        # Выборка готовых задач воркером outbox
+        Index("ix_crm_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
@@ -0,0 +1,101 @@
+import asyncio
+import math
+import time
+from app.core.config import settings
+
+class AdmissionRejected(Exception):
+    """Запрос отклонен: воркер перегружен"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Admission control для запросов чата.
+
+    Одновременно обрабатывается не больше max_concurrent запросов, остальные ждут
+    в очереди не дольше queue_max_wait. Если очередь полна или время ожидания
+    вышло, запрос сразу отклоняется (503 с Retry-After), а не копится за медленными
+    вызовами ИИ, пока клиент не отвалится по таймауту.
+    """
+
+    def __init__(self, max_concurrent: int, queue_max_size: int, queue_max_wait: float):
+        self.max_concurrent = max_concurrent
+        self.queue_max_size = queue_max_size
+        self.queue_max_wait = queue_max_wait
+        self._slots = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.queue_seconds = 0.0
+        self._avg_service_seconds = 1.0  # EWMA времени обработки запроса
+
+    @property
+    def enabled(self) -> bool:
+        return self._slots is not None
+
+    def retry_after(self) -> int:
+        """Оценка, через сколько секунд освободится место (для заголовка Retry-After)"""
+        waves = self.queue_depth / max(1, self.max_concurrent) + 1
+        return max(1, min(30, math.ceil(self._avg_service_seconds * waves)))
+
+    async def acquire(self) -> float:
+        """
+        Занять слот обработки; вернуть момент начала обработки (для release)
+        
+        Raises:
+            AdmissionRejected: очередь переполнена или место не освободилось за queue_max_wait
+        """
+        if not self.enabled:
+            return time.monotonic()
+        if self._slots.locked():
+            if self.queue_depth >= self.queue_max_size:
+                self.shed_queue_full += 1
+                raise AdmissionRejected("queue_full", self.retry_after())
+            self.queued += 1
+        self.queue_depth += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_max_wait)
+        except asyncio.TimeoutError:
+            self.shed_timeout += 1
+            raise AdmissionRejected("queue_timeout", self.retry_after())
+        finally:
+            self.queue_depth -= 1
+            self.queue_seconds += time.monotonic() - started
+        self.admitted += 1
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, service_started: float):
+        if not self.enabled:
+            return
+        self.in_flight -= 1
+        self._slots.release()
+        self._avg_service_seconds += 0.2 * (time.monotonic() - service_started - self._avg_service_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_max_size": self.queue_max_size,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "queue_seconds": round(self.queue_seconds, 3),
+            "avg_service_seconds": round(self._avg_service_seconds, 3),
+        }
+
+chat_admission = AdmissionController(
+    max_concurrent=settings.chat_max_concurrent,
+    queue_max_size=settings.chat_queue_max_size,
+    queue_max_wait=settings.chat_queue_max_wait
+)
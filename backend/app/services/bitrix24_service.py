@@ -34,7 +34,7 @@ class Bitrix24Service:
             # По умолчанию добавляем +7
             return '+7' + digits[-10:] if len(digits) >= 10 else phone
     
-    async def create_lead(self, name: str, phone: str, comments: Optional[str] = None) -> Dict:
+    async def create_lead(self, name: str, phone: str, comments: Optional[str] = None, timeout: Optional[float] = None) -> Dict:
         """
         Создание лида в Bitrix24
         
@@ -42,6 +42,7 @@ class Bitrix24Service:
             name: Имя контакта
             phone: Номер телефона
             comments: Дополнительные комментарии (опционально)
+            timeout: Таймаут запроса в секундах (по умолчанию bitrix24_timeout)
         
         Returns:
             Dict с результатом операции
@@ -82,7 +83,7 @@ class Bitrix24Service:
         try:
             # Убеждаемся, что URL заканчивается на /
             webhook_url = self.webhook_url.rstrip('/') + '/'
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with httpx.AsyncClient(timeout=timeout or settings.bitrix24_timeout) as client:
                 response = await client.post(
                     f"{webhook_url}crm.lead.add",
                     json=payload
@@ -0,0 +1,140 @@
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+from app.core.config import settings
+from app.utils.bm25 import tokenize
+from app.utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Совпадение короче этого считается случайным, а не перекрытием соседних чанков
+MIN_OVERLAP_CHARS = 8
+
+@dataclass
+class Passage:
+    """Фрагмент контекста: один чанк или несколько соседних чанков одного документа"""
+    text: str
+    score: float
+    metadata: dict
+    chunk_indexes: List[int] = field(default_factory=list)
+    terms: frozenset = frozenset()
+
+    def to_result(self) -> dict:
+        metadata = {k: v for k, v in self.metadata.items() if k != "chunk_index"}
+        if self.chunk_indexes:
+            metadata["chunk_indexes"] = self.chunk_indexes
+        return {"text": self.text, "score": self.score, "metadata": metadata}
+
+def merge_overlapping(left: str, right: str) -> str:
+    """Склеить соседние чанки, убрав общий текст на стыке"""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left} {right}"
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Доля общих слов относительно меньшего фрагмента (1.0 - один содержится в другом)"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+class ContextBuilder:
+    """
+    Сборка фрагментов базы знаний для промпта.
+
+    Соседние чанки одного документа склеиваются без перекрытия, почти одинаковые
+    фрагменты отбрасываются, при context_mmr_enabled порядок выбирается по MMR
+    (релевантность против сходства с уже выбранными), и фрагменты добавляются,
+    пока укладываются в context_token_budget.
+    """
+
+    def merge_adjacent(self, search_results: list) -> List[Passage]:
+        """Объединить найденные чанки с последовательными chunk_index одного документа"""
+        passages = []
+        by_document: dict = {}
+        for result in search_results:
+            metadata = result.get("metadata") or {}
+            if metadata.get("document_id") is None or metadata.get("chunk_index") is None:
+                passages.append(Passage(result["text"], result.get("score", 0.0), metadata))
+                continue
+            by_document.setdefault(metadata["document_id"], []).append(result)
+
+        for results in by_document.values():
+            results.sort(key=lambda item: item["metadata"]["chunk_index"])
+            current = None
+            for result in results:
+                chunk_index = result["metadata"]["chunk_index"]
+                if current is not None and chunk_index == current.chunk_indexes[-1] + 1:
+                    current.text = merge_overlapping(current.text, result["text"])
+                    current.score = max(current.score, result.get("score", 0.0))
+                    current.chunk_indexes.append(chunk_index)
+                    continue
+                current = Passage(result["text"], result.get("score", 0.0), result["metadata"], [chunk_index])
+                passages.append(current)
+
+        for passage in passages:
+            passage.terms = frozenset(tokenize(passage.text))
+        passages.sort(key=lambda passage: passage.score, reverse=True)
+        return passages
+
+    @staticmethod
+    def drop_duplicates(passages: List[Passage], threshold: float) -> List[Passage]:
+        """Отбросить фрагменты, почти совпадающие с более релевантными"""
+        kept = []
+        for passage in passages:
+            if all(similarity(passage.terms, other.terms) < threshold for other in kept):
+                kept.append(passage)
+        return kept
+
+    @staticmethod
+    def diversify(passages: List[Passage], mmr_lambda: float) -> List[Passage]:
+        """Порядок по Maximal Marginal Relevance (сходство - по словам фрагментов)"""
+        if len(passages) < 3:
+            return passages
+        top_score = passages[0].score or 1.0
+        remaining = list(passages)
+        selected = []
+        while remaining:
+            def mmr(passage: Passage) -> float:
+                redundancy = max((similarity(passage.terms, other.terms) for other in selected), default=0.0)
+                return mmr_lambda * passage.score / top_score - (1 - mmr_lambda) * redundancy
+            best = max(remaining, key=mmr)
+            remaining.remove(best)
+            selected.append(best)
+        return selected
+
+    @staticmethod
+    def fit_budget(passages: List[Passage], budget: int) -> List[Passage]:
+        """
+        Фрагменты в пределах бюджета токенов
+
+        Не помещающийся фрагмент пропускается (меньшие ниже по списку еще могут войти);
+        самый релевантный фрагмент обрезается, если один превышает бюджет.
+        """
+        kept = []
+        used = 0
+        for passage in passages:
+            tokens = count_tokens(passage.text)
+            if used + tokens <= budget:
+                kept.append(passage)
+                used += tokens
+            elif not kept and tokens:
+                passage.text = passage.text[:len(passage.text) * budget // tokens]
+                kept.append(passage)
+                used = budget
+        return kept
+
+    def build(self, search_results: list, token_budget: Optional[int] = None) -> list:
+        """Фрагменты для промпта в формате результатов поиска (text, score, metadata)"""
+        if not search_results:
+            return []
+        budget = settings.context_token_budget if token_budget is None else token_budget
+        passages = self.merge_adjacent(search_results)
+        passages = self.drop_duplicates(passages, settings.context_dedup_threshold)
+        if settings.context_mmr_enabled:
+            passages = self.diversify(passages, settings.context_mmr_lambda)
+        passages = self.fit_budget(passages, budget)
+        logger.debug(f"Контекст: {len(search_results)} чанков -> {len(passages)} фрагментов")
+        return [passage.to_result() for passage in passages]
+
+context_builder = ContextBuilder()
@@ -0,0 +1,147 @@
+"""
+Бэкенды модели эмбеддингов.
+
+torch - sentence-transformers через HuggingFaceEmbeddings (как раньше).
+onnx - тот же MiniLM, экспортированный в ONNX (scripts/export_onnx_model.py), на ONNX Runtime
+без загрузки torch; при embedding_onnx_quantized - веса с динамическим квантованием int8.
+Методы синхронные и CPU-bound: KnowledgeService вызывает их в пуле потоков.
+"""
+import os
+from abc import ABC, abstractmethod
+from typing import List
+import numpy as np
+from app.core.config import settings
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "models")
+
+def default_onnx_dir(model_name: str) -> str:
+    return os.path.join(MODELS_DIR, model_name.split("/")[-1])
+
+def onnx_dir(model_name: str) -> str:
+    return settings.embedding_onnx_path or default_onnx_dir(model_name)
+
+def backend_name(model_name: str, backend: str = None, quantized: bool = None) -> str:
+    """Имя бэкенда с моделью: входит в ключ кэша эмбеддингов (векторы бэкендов не идентичны)"""
+    backend = backend or settings.embedding_backend
+    quantized = settings.embedding_onnx_quantized if quantized is None else quantized
+    if backend == "onnx" and quantized:
+        backend = "onnx-int8"
+    return f"{backend}:{model_name}"
+
+class EmbeddingBackend(ABC):
+    name: str = ""
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+class TorchEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, model_name: str, batch_size: int):
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        self.name = backend_name(model_name, "torch")
+        self._model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._model.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._model.embed_documents(texts)
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """Трансформер в ONNX Runtime + mean pooling по attention mask (как в sentence-transformers)"""
+
+    def __init__(self, model_dir: str, model_name: str, batch_size: int, max_seq_length: int,
+                 quantized: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        path = os.path.join(model_dir, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"ONNX модель не найдена: {path}. Выполните python scripts/export_onnx_model.py"
+                + (" --quantize" if quantized else "")
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = [item.name for item in self._session.get_inputs()]
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.max_seq_length = max_seq_length
+        self.name = backend_name(model_name, "onnx", quantized)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self._tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        hidden = self._session.run(None, feeds)[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Батчи из текстов близкой длины - меньше padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            indexes = order[start:start + self.batch_size]
+            for index, vector in zip(indexes, self._encode_batch([texts[i] for i in indexes])):
+                vectors[index] = vector.tolist()
+        return vectors
+
+def create_embedding_backend(model_name: str) -> EmbeddingBackend:
+    if settings.embedding_backend == "torch":
+        return TorchEmbeddingBackend(model_name, settings.embedding_batch_size)
+    if settings.embedding_backend == "onnx":
+        return OnnxEmbeddingBackend(
+            onnx_dir(model_name),
+            model_name,
+            batch_size=settings.embedding_batch_size,
+            max_seq_length=settings.embedding_max_seq_length,
+            quantized=settings.embedding_onnx_quantized,
+            threads=settings.embedding_onnx_threads
+        )
+    raise ValueError(f"Неизвестный бэкенд эмбеддингов: {settings.embedding_backend}")
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14):
+    """
+    Экспорт модели в ONNX (нужен torch) и, при quantize, динамическое квантование весов в int8
+
+    Рядом сохраняется токенизатор, чтобы onnx-бэкенд не обращался к Hugging Face Hub.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = dict(tokenizer(["Пример текста для экспорта модели"], return_tensors="pt"))
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        # Словарь последним аргументом передается в forward как именованные аргументы
+        torch.onnx.export(
+            model,
+            (sample,),
+            path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, os.path.join(output_dir, ONNX_INT8_MODEL_FILE), weight_type=QuantType.QInt8)
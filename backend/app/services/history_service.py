@@ -0,0 +1,239 @@
+import asyncio
+import logging
+from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import HISTORY_DB_SECONDS
+from app.db.database import AsyncSessionLocal
+from app.models.db_models import Contact, Message, SessionSummary
+from app.services.ai_service import ai_service
+from app.services.session_state import ContactSnapshot, HistoryMessage, SessionState, session_state_store
+from app.utils.timing import request_stage
+from app.utils.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+def build_conversation_history(messages: list) -> list:
+    """Формирование истории разговора для ИИ из обменов репликами в БД"""
+    conversation_history = []
+    for msg in messages:
+        conversation_history.append({
+            "role": "user",
+            "content": msg.message
+        })
+        if msg.response:
+            conversation_history.append({
+                "role": "assistant",
+                "content": msg.response
+            })
+    return conversation_history
+
+def build_summary_message(summary_text: str) -> Optional[dict]:
+    """Системное сообщение с кратким содержанием свернутой части диалога"""
+    if not summary_text:
+        return None
+    return {
+        "role": "system",
+        "content": f"Краткое содержание предыдущей части диалога:\n{summary_text}"
+    }
+
+class HistoryService:
+    """
+    История разговора в пределах бюджета токенов.
+
+    В промпт попадают самые новые сообщения, укладывающиеся в history_token_budget.
+    Более старые сообщения сворачиваются в скользящее резюме сессии (session_summaries),
+    которое дополняется инкрементально в фоне, а не пересобирается с нуля.
+    """
+
+    def __init__(self):
+        self._summarizing: set = set()
+        self._tasks: set = set()
+
+    async def load(self, db: AsyncSession, session_id: str) -> tuple[list, Optional[SessionSummary]]:
+        """Загрузка резюме сессии и сообщений, еще не вошедших в него"""
+        summary = await db.get(SessionSummary, session_id)
+        last_message_id = summary.last_message_id if summary else 0
+        result = await db.execute(
+            select(Message)
+            .where(Message.session_id == session_id, Message.id > last_message_id)
+            .order_by(Message.id.desc())
+            .limit(settings.history_max_messages)
+        )
+        messages = [HistoryMessage.from_row(msg) for msg in reversed(result.scalars().all())]
+        return messages, summary
+    
+    async def get_session_state(self, db: AsyncSession, session_id: str) -> SessionState:
+        """
+        Состояние сессии: из кэша, а при промахе - из БД
+        
+        Контакт берется из тех же строк сообщений (LEFT JOIN), без запроса на каждое сообщение.
+        """
+        state = await session_state_store.get(session_id)
+        if state is not None:
+            if not settings.session_state_validate_hits:
+                return state
+            # Ход сессии мог обработать другой воркер: сверяем одну строку вместо загрузки истории
+            with request_stage("db"):
+                db_version = await self._session_db_version(db, session_id)
+            if db_version == state.db_version:
+                return state
+        
+        # Поколение до чтения: если резюме обновится во время загрузки, состояние не попадет в кэш
+        generation = await session_state_store.generation(session_id)
+        with HISTORY_DB_SECONDS.time(), request_stage("db"):
+            state = await self._load_session_state(db, session_id)
+        state.generation = generation
+        await session_state_store.set(session_id, state)
+        return state
+    
+    @staticmethod
+    async def _session_db_version(db: AsyncSession, session_id: str) -> tuple[int, int]:
+        """(id последнего сообщения сессии, last_message_id резюме) - меняется при каждом ходе и сворачивании"""
+        result = await db.execute(select(
+            select(func.max(Message.id)).where(Message.session_id == session_id).scalar_subquery(),
+            select(SessionSummary.last_message_id).where(SessionSummary.session_id == session_id).scalar_subquery()
+        ))
+        last_message_id, summary_message_id = result.one()
+        return (last_message_id or 0, summary_message_id or 0)
+    
+    async def _load_session_state(self, db: AsyncSession, session_id: str) -> SessionState:
+        db_version = await self._session_db_version(db, session_id)
+        summary = await db.get(SessionSummary, session_id)
+        last_message_id = summary.last_message_id if summary else 0
+        result = await db.execute(
+            select(Message, Contact)
+            .outerjoin(Contact, Contact.id == Message.contact_id)
+            .where(Message.session_id == session_id, Message.id > last_message_id)
+            .order_by(Message.id.desc())
+            .limit(settings.history_max_messages)
+        )
+        rows = list(reversed(result.all()))
+        
+        contact = next((row_contact for _, row_contact in reversed(rows) if row_contact is not None), None)
+        if contact is None and summary is not None:
+            # Все сообщения с контактом уже свернуты в резюме - ищем контакт по сессии отдельно
+            contact_result = await db.execute(
+                select(Contact)
+                .join(Message, Message.contact_id == Contact.id)
+                .where(Message.session_id == session_id)
+                .limit(1)
+            )
+            contact = contact_result.scalars().first()
+        
+        return SessionState(
+            contact=ContactSnapshot.from_contact(contact),
+            summary=summary.summary if summary else "",
+            messages=[HistoryMessage.from_row(msg) for msg, _ in rows],
+            db_version=db_version
+        )
+    
+    async def record_turn(self, session_id: str, state: SessionState, contact: Optional[Contact], new_messages: list):
+        """
+        Write-through обновление кэша после сохранения обмена репликами
+        
+        Если за время хода резюме обновилось (invalidate), запись пропускается - следующий ход перечитает БД.
+        """
+        state.contact = ContactSnapshot.from_contact(contact) if contact is not None else state.contact
+        state.messages = (state.messages + [HistoryMessage.from_row(msg) for msg in new_messages])[-settings.history_max_messages:]
+        if new_messages:
+            state.db_version = (new_messages[-1].id, state.db_version[1])
+        await session_state_store.set(session_id, state)
+
+    @staticmethod
+    def split_by_budget(messages: list, budget: int) -> tuple[list, list]:
+        """
+        Разделить обмены репликами на (старые, новые): новые - самый свежий хвост,
+        который укладывается в budget токенов
+        """
+        used = 0
+        index = len(messages)
+        while index > 0:
+            tokens = count_message_tokens(build_conversation_history([messages[index - 1]]))
+            if used + tokens > budget:
+                break
+            used += tokens
+            index -= 1
+        return messages[:index], messages[index:]
+
+    def build(self, session_id: str, messages: list, summary_text: str) -> list:
+        """История для промпта: резюме + свежие сообщения в пределах бюджета"""
+        summary_message = build_summary_message(summary_text)
+        budget = settings.history_token_budget
+        if summary_message:
+            budget -= count_message_tokens([summary_message])
+
+        older, recent = self.split_by_budget(messages, max(0, budget))
+        if older:
+            # Не влезающие сообщения не отправляются; в фоне сворачиваем их в резюме
+            self.schedule_summary_update(session_id)
+
+        history = build_conversation_history(recent)
+        return [summary_message] + history if summary_message else history
+
+    def schedule_summary_update(self, session_id: str):
+        """Запустить фоновое обновление резюме (не более одного на сессию)"""
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        task = asyncio.create_task(self._update_summary(session_id))
+        self._tasks.add(task)
+
+        def _done(finished_task):
+            self._tasks.discard(finished_task)
+            self._summarizing.discard(session_id)
+
+        task.add_done_callback(_done)
+
+    async def _load_unsummarized_page(self, db: AsyncSession, session_id: str, after_id: int, before_id: int) -> list:
+        """Самые старые несвернутые обмены между after_id и before_id (не больше history_max_messages)"""
+        result = await db.execute(
+            select(Message)
+            .where(Message.session_id == session_id, Message.id > after_id, Message.id < before_id)
+            .order_by(Message.id)
+            .limit(settings.history_max_messages)
+        )
+        return [HistoryMessage.from_row(msg) for msg in result.scalars().all()]
+
+    async def _update_summary(self, session_id: str):
+        try:
+            async with AsyncSessionLocal() as db:
+                messages, summary = await self.load(db, session_id)
+                # Сворачиваем с запасом (до target_ratio бюджета), чтобы не вызывать ИИ на каждом ходе
+                target = int(settings.history_token_budget * settings.history_summary_target_ratio)
+                older, recent = self.split_by_budget(messages, target)
+                if not older:
+                    return
+
+                # Сворачивается все до первого оставляемого сообщения. Несвернутых сообщений
+                # может быть больше окна load, поэтому идем страницами от самого старого
+                keep_from = recent[0].id if recent else older[-1].id + 1
+                summary_text = summary.summary if summary else ""
+                last_message_id = summary.last_message_id if summary else 0
+                folded = 0
+                while page := await self._load_unsummarized_page(db, session_id, last_message_id, keep_from):
+                    new_summary = await ai_service.update_rolling_summary(
+                        summary_text, build_conversation_history(page)
+                    )
+                    if not new_summary:
+                        logger.warning(f"Не удалось обновить резюме сессии {session_id}")
+                        break
+
+                    if summary is None:
+                        summary = SessionSummary(session_id=session_id)
+                        db.add(summary)
+                    summary.summary = summary_text = new_summary
+                    summary.last_message_id = last_message_id = page[-1].id
+                    # Каждая страница фиксируется: прерванное сворачивание продолжится с этого места
+                    await db.commit()
+                    folded += len(page)
+
+                if folded:
+                    # Кэшированное состояние содержит уже свернутые сообщения - перечитаем при следующем ходе
+                    await session_state_store.invalidate(session_id)
+                    logger.info(f"Резюме сессии {session_id} обновлено: свернуто {folded} сообщений")
+        except Exception as e:
+            logger.error(f"Ошибка обновления резюме сессии {session_id}: {e}", exc_info=True)
+
+history_service = HistoryService()
@@ -1,25 +1,74 @@
 import os
-from qdrant_client import QdrantClient
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_openai import OpenAIEmbeddings
+from sqlalchemy import select, update
 from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.db_models import KnowledgeBaseState
+from app.core.metrics import EMBEDDING_SECONDS, QDRANT_SECONDS, RETRIEVAL_RESULTS, record_error
+from app.services.embedding_backends import backend_name, create_embedding_backend
+from app.utils.bm25 import BM25Index, reciprocal_rank_fusion
+from app.utils.cache import LRUCache
+from app.utils.chunking import build_text_splitter, load_tokenizer
+from app.utils.timing import request_stage
 from typing import List, Optional
 import uuid
 
+# Порог косинусной близости векторного поиска по умолчанию
+SEARCH_SCORE_THRESHOLD = 0.2
+
 class KnowledgeService:
     def __init__(self):
         self.qdrant_url = settings.qdrant_url.replace("http://", "").replace("https://", "")
         if ":" in self.qdrant_url:
             host, port = self.qdrant_url.split(":")
             self.qdrant_client = QdrantClient(host=host, port=int(port))
+            self.async_qdrant_client = AsyncQdrantClient(host=host, port=int(port))
         else:
             self.qdrant_client = QdrantClient(url=settings.qdrant_url)
+            self.async_qdrant_client = AsyncQdrantClient(url=settings.qdrant_url)
         
         self.collection_name = "knowledge_base"
-        self.embedding_model = None  # Ленивая загрузка
+        self.embedding_backend = None  # Ленивая загрузка
+        self._text_splitter = None  # Ленивая загрузка токенизатора модели
         self._model_name = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+        # Бэкенд и модель: векторы torch и onnx/int8 близки, но не идентичны
+        self._embedding_name = backend_name(self._model_name)
+        
+        # Кодирование эмбеддингов (CPU-bound) выполняется вне event loop в ограниченном пуле потоков,
+        # а семафор ограничивает число задач, ожидающих в очереди пула
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.embedding_executor_workers,
+            thread_name_prefix="embedding"
+        )
+        self._embedding_slots = asyncio.Semaphore(settings.embedding_executor_max_pending)
+        self._model_lock = threading.Lock()
+        
+        # Кэш эмбеддингов запросов: ключ - (бэкенд и модель, нормализованный текст запроса)
+        self.query_embedding_cache = LRUCache(
+            maxsize=settings.query_embedding_cache_size,
+            ttl=settings.query_embedding_cache_ttl
+        )
+        
+        # Версия базы знаний: меняется при каждом добавлении/удалении документа.
+        # По ней инвалидируются кэши, зависящие от содержимого базы (ответы ИИ и т.п.).
+        # Общая версия хранится в БД (knowledge_base_state), здесь - последняя прочитанная воркером
+        self.kb_version = 0
+        self._kb_version_checked_at = 0.0
+        
+        # Лексический индекс BM25 по тексту чанков (Qdrant 1.6 не поддерживает sparse-векторы).
+        # Перестраивается в фоне при смене kb_version или по интервалу; до готовности поиск только векторный
+        self._lexical_index: Optional[BM25Index] = None
+        self._lexical_payloads: dict = {}
+        self._lexical_index_version = -1
+        self._lexical_index_built_at = 0.0
+        self._lexical_rebuild: Optional[asyncio.Task] = None
+        self.lexical_index_rebuilds = 0
         
         # Создаем коллекцию если не существует
         try:
@@ -30,138 +79,296 @@ class KnowledgeService:
                 vectors_config=VectorParams(size=384, distance=Distance.COSINE)
             )
     
-    def _get_embedding_model(self):
-        """Ленивая загрузка модели эмбеддингов"""
-        if self.embedding_model is None:
-            print("Загрузка модели эмбеддингов...")
-            self.embedding_model = HuggingFaceEmbeddings(
-                model_name=self._model_name
-            )
-            print("Модель эмбеддингов загружена")
-        return self.embedding_model
+    def _get_embedding_backend(self):
+        """Ленивая загрузка модели эмбеддингов (потокобезопасная)"""
+        if self.embedding_backend is None:
+            with self._model_lock:
+                if self.embedding_backend is None:
+                    print(f"Загрузка модели эмбеддингов ({self._embedding_name})...")
+                    self.embedding_backend = create_embedding_backend(self._model_name)
+                    print("Модель эмбеддингов загружена")
+        return self.embedding_backend
+    
+    def _get_text_splitter(self):
+        """Разбиение на чанки по токенам модели эмбеддингов (ленивая загрузка токенизатора)"""
+        if self._text_splitter is None:
+            with self._model_lock:
+                if self._text_splitter is None:
+                    self._text_splitter = build_text_splitter(
+                        load_tokenizer(self._model_name),
+                        chunk_size=settings.chunk_size_tokens,
+                        chunk_overlap=settings.chunk_overlap_tokens,
+                        max_seq_length=settings.embedding_max_seq_length
+                    )
+        return self._text_splitter
+    
+    async def _run_in_executor(self, func, *args):
+        """Выполнить CPU-bound функцию в пуле эмбеддингов, не блокируя event loop"""
+        async with self._embedding_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+    
+    async def embed_query(self, text: str) -> List[float]:
+        """Эмбеддинг запроса (с LRU/TTL кэшем по тексту запроса)"""
+        # Модель входит в ключ: векторы другой модели или бэкенда из кэша не вернутся
+        cache_key = (self._embedding_name, text)
+        embedding = self.query_embedding_cache.get(cache_key)
+        if embedding is not None:
+            return embedding
+        
+        # Модель загружается лениво внутри пула, чтобы первая загрузка тоже не блокировала loop
+        with EMBEDDING_SECONDS.labels(kind="query").time(), request_stage("embed"):
+            embedding = await self._run_in_executor(lambda: self._get_embedding_backend().embed_query(text))
+        self.query_embedding_cache.set(cache_key, embedding)
+        return embedding
+    
+    def query_embedding_cache_stats(self) -> dict:
+        """Счетчики кэша эмбеддингов запросов"""
+        return {
+            **self.query_embedding_cache.stats(),
+            "model": self._embedding_name
+        }
+    
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Эмбеддинги батча текстов"""
+        with EMBEDDING_SECONDS.labels(kind="documents").time(), request_stage("embed"):
+            return await self._run_in_executor(lambda: self._get_embedding_backend().embed_documents(texts))
+    
+    async def startup(self):
+        """Построить лексический индекс в фоне (вызывается при старте приложения)"""
+        self._ensure_lexical_index()
     
-    def add_document(self, text: str, document_id: int, metadata: dict = None) -> bool:
+    async def shutdown(self):
+        """Освободить ресурсы (вызывается при остановке приложения)"""
+        if self._lexical_rebuild is not None:
+            self._lexical_rebuild.cancel()
+        await self.async_qdrant_client.close()
+        self._executor.shutdown(wait=False)
+    
+    async def add_document(self, text: str, document_id: int, metadata: dict = None) -> bool:
         """Добавить документ в базу знаний"""
         try:
-            # Разбиваем текст на чанки (уменьшаем размер для лучшего поиска имен)
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=500,  # Уменьшили для лучшего поиска конкретных имен
-                chunk_overlap=100,  # Уменьшили overlap
-                length_function=len,
-            )
-            chunks = text_splitter.split_text(text)
+            # Разбиваем текст на чанки, которые модель эмбеддингов кодирует целиком
+            chunks = await self._run_in_executor(lambda: self._get_text_splitter().split_text(text))
             print(f"Документ разбит на {len(chunks)} чанков")
             
-            # Создаем эмбеддинги для каждого чанка
-            embedding_model = self._get_embedding_model()
-            points = []
-            for i, chunk in enumerate(chunks):
-                embedding = embedding_model.embed_query(chunk)
-                point_id = str(uuid.uuid4())
+            # Создаем эмбеддинги и добавляем в Qdrant батчами, чтобы не держать
+            # в памяти все точки большого документа и не кодировать чанки по одному
+            batch_size = max(1, settings.qdrant_upsert_batch_size)
+            for start in range(0, len(chunks), batch_size):
+                batch = chunks[start:start + batch_size]
+                # embed_documents кодирует батч за несколько forward pass (по embedding_batch_size)
+                embeddings = await self.embed_documents(batch)
                 
-                point_metadata = {
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "text": chunk,
-                    **(metadata or {})
-                }
+                points = []
+                for i, (chunk, embedding) in enumerate(zip(batch, embeddings), start):
+                    point_metadata = {
+                        "document_id": document_id,
+                        "chunk_index": i,
+                        "text": chunk,
+                        **(metadata or {})
+                    }
+                    points.append(PointStruct(
+                        id=str(uuid.uuid4()),
+                        vector=embedding,
+                        payload=point_metadata
+                    ))
                 
-                points.append(PointStruct(
-                    id=point_id,
-                    vector=embedding,
-                    payload=point_metadata
-                ))
-            
-            # Добавляем в Qdrant
-            self.qdrant_client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+                # Последний батч ждем всегда: после смены kb_version лексический индекс и кэши
+                # перестраиваются по содержимому Qdrant, и в нем уже должны быть все чанки
+                # (операции коллекции применяются по порядку, поэтому готовы и предыдущие батчи)
+                is_last_batch = start + batch_size >= len(chunks)
+                with QDRANT_SECONDS.labels(operation="upsert").time(), request_stage("qdrant"):
+                    await self.async_qdrant_client.upsert(
+                        collection_name=self.collection_name,
+                        points=points,
+                        wait=settings.qdrant_upsert_wait or is_last_batch
+                    )
             return True
         except Exception as e:
             print(f"Error adding document to knowledge base: {e}")
             return False
+        finally:
+            # Содержимое базы знаний могло измениться (даже частично) - сбрасываем зависимые кэши
+            await self._bump_kb_version()
+    
+    async def refresh_kb_version(self):
+        """
+        Сверить версию базы знаний с БД (не чаще kb_version_refresh_interval)
+        
+        Так изменения, сделанные через другой воркер, сбрасывают кэши этого воркера.
+        При ошибке БД остается последняя известная версия.
+        """
+        now = time.monotonic()
+        if now - self._kb_version_checked_at < settings.kb_version_refresh_interval:
+            return
+        # Отмечаем до запроса, чтобы одновременные ходы не читали версию каждый
+        self._kb_version_checked_at = now
+        try:
+            async with AsyncSessionLocal() as db:
+                version = await db.scalar(select(KnowledgeBaseState.version).where(KnowledgeBaseState.id == 1))
+            if version is not None:
+                self.kb_version = version
+        except Exception as e:
+            record_error("kb_version", e)
+            print(f"Error reading knowledge base version: {e}")
     
-    def search(self, query: str, limit: int = 10, score_threshold: float = 0.2) -> List[dict]:
-        """Поиск в базе знаний с гибридным поиском"""
+    async def _bump_kb_version(self):
+        """Увеличить общую версию базы знаний в БД; без БД - только версию этого воркера"""
         try:
-            import re
+            async with AsyncSessionLocal() as db:
+                version = await db.scalar(
+                    update(KnowledgeBaseState)
+                    .where(KnowledgeBaseState.id == 1)
+                    .values(version=KnowledgeBaseState.version + 1)
+                    .returning(KnowledgeBaseState.version)
+                )
+                await db.commit()
+        except Exception as e:
+            record_error("kb_version", e)
+            print(f"Error updating knowledge base version: {e}")
+            version = None
+        self.kb_version = version if version is not None else self.kb_version + 1
+        self._kb_version_checked_at = time.monotonic()
+    
+    def _lexical_index_stale(self) -> bool:
+        if self._lexical_index_version != self.kb_version:
+            return True
+        return time.monotonic() - self._lexical_index_built_at >= settings.lexical_index_refresh_interval
+    
+    def _ensure_lexical_index(self):
+        """Запустить перестроение лексического индекса, если он устарел (не более одного одновременно)"""
+        if not settings.hybrid_search_enabled or not self._lexical_index_stale():
+            return
+        if self._lexical_rebuild is not None and not self._lexical_rebuild.done():
+            return
+        self._lexical_rebuild = asyncio.create_task(self._rebuild_lexical_index())
+    
+    async def _rebuild_lexical_index(self):
+        version = self.kb_version
+        try:
+            payloads = {}
+            offset = None
+            while True:
+                points, offset = await self.async_qdrant_client.scroll(
+                    collection_name=self.collection_name,
+                    limit=1000,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                for point in points:
+                    payloads[str(point.id)] = point.payload or {}
+                if offset is None:
+                    break
             
-            # Нормализуем запрос: убираем лишние слова для лучшего поиска имен
+            index = await self._run_in_executor(
+                lambda: BM25Index(
+                    ((key, payload.get("text", "")) for key, payload in payloads.items()),
+                    k1=settings.bm25_k1,
+                    b=settings.bm25_b
+                )
+            )
+            self._lexical_index, self._lexical_payloads = index, payloads
+            self._lexical_index_version = version
+            self._lexical_index_built_at = time.monotonic()
+            self.lexical_index_rebuilds += 1
+            print(f"Лексический индекс построен: {len(index)} чанков")
+        except Exception as e:
+            record_error("lexical_index", e)
+            print(f"Error building lexical index: {e}")
+            # Повторим не раньше чем через интервал обновления
+            self._lexical_index_built_at = time.monotonic()
+            if self._lexical_index is None:
+                self._lexical_index_version = version
+    
+    def lexical_index_stats(self) -> dict:
+        """Состояние лексического индекса"""
+        return {
+            "enabled": settings.hybrid_search_enabled,
+            "ready": self._lexical_index is not None,
+            "version": self._lexical_index_version,
+            "kb_version": self.kb_version,
+            "rebuilds": self.lexical_index_rebuilds,
+            **(self._lexical_index.stats() if self._lexical_index is not None else {})
+        }
+    
+    @staticmethod
+    def _to_result(payload: dict, score: float) -> dict:
+        return {
+            "text": payload.get("text", ""),
+            "score": score,
+            "metadata": {k: v for k, v in payload.items() if k != "text"}
+        }
+    
+    async def search(self, query: str, limit: int = 10, score_threshold: float = SEARCH_SCORE_THRESHOLD) -> List[dict]:
+        """
+        Гибридный поиск в базе знаний: векторный (Qdrant) + лексический (BM25), слияние RRF
+        
+        score результата - RRF-оценка; dense_score (косинус) и lexical_score (BM25)
+        присутствуют, если фрагмент найден соответствующим поиском.
+        """
+        try:
             query_normalized = query.lower().strip()
-            extracted_name = None
+            self._ensure_lexical_index()
             
-            # Если запрос содержит "кто такая", "кто такой", "who is" - извлекаем имя
-            name_patterns = [
-                r'(?:кто такая|кто такой|who is|tell me about)\s+([A-Z][a-z]+\s+[A-Z][a-z]+)',
-                r'([A-Z][a-z]+\s+[A-Z][a-z]+)',  # Просто имя и фамилия
-            ]
-            for pattern in name_patterns:
-                match = re.search(pattern, query, re.IGNORECASE)
-                if match:
-                    extracted_name = match.group(1)
-                    query_normalized = extracted_name.lower()
-                    print(f"Извлечено имя из запроса: {query_normalized}")
-                    break
-            
-            # Создаем эмбеддинг для запроса
-            embedding_model = self._get_embedding_model()
-            query_embedding = embedding_model.embed_query(query_normalized)
+            # Лексический поиск синхронный и быстрый - выполняем до ожидания эмбеддинга
+            lexical_index, lexical_payloads = self._lexical_index, self._lexical_payloads
+            lexical_hits = []
+            if settings.hybrid_search_enabled and lexical_index is not None:
+                with request_stage("bm25"):
+                    lexical_hits = lexical_index.search(query_normalized, limit)
             
-            # Ищем в Qdrant (берем больше результатов)
-            results = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=limit * 2  # Берем больше для гибридного поиска
-            )
+            query_embedding = await self.embed_query(query_normalized)
+            with QDRANT_SECONDS.labels(operation="search").time(), request_stage("qdrant"):
+                results = await self.async_qdrant_client.search(
+                    collection_name=self.collection_name,
+                    query_vector=query_embedding,
+                    limit=limit
+                )
             
-            # Формируем результат
-            search_results = []
+            candidates = {}
+            dense_ranking = []
             for result in results:
-                text = result.payload.get("text", "")
-                score = result.score
-                
-                # Гибридный поиск: повышаем score если найдено имя в тексте
-                if extracted_name:
-                    name_lower = extracted_name.lower()
-                    if name_lower in text.lower():
-                        # Повышаем score на 0.2 если имя найдено в тексте
-                        score = min(1.0, score + 0.2)
-                        print(f"  Повышен score для фрагмента с именем: {score:.3f}")
-                
-                if score >= score_threshold:
-                    search_results.append({
-                        "text": text,
-                        "score": score,
-                        "metadata": {k: v for k, v in result.payload.items() if k != "text"}
-                    })
+                if result.score < score_threshold:
+                    continue
+                key = str(result.id)
+                candidates[key] = self._to_result(result.payload, result.score)
+                candidates[key]["dense_score"] = result.score
+                dense_ranking.append(key)
+            
+            lexical_ranking = []
+            for key, lexical_score in lexical_hits:
+                if key not in candidates:
+                    candidates[key] = self._to_result(lexical_payloads.get(key, {}), 0.0)
+                candidates[key]["lexical_score"] = lexical_score
+                lexical_ranking.append(key)
             
-            # Сортируем по score (от большего к меньшему) и берем топ limit
-            search_results.sort(key=lambda x: x['score'], reverse=True)
-            final_results = search_results[:limit]
+            final_results = []
+            for key, fused_score in reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=settings.rrf_k)[:limit]:
+                candidates[key]["score"] = fused_score
+                final_results.append(candidates[key])
             
-            # Если нет результатов с порогом, пробуем более низкий порог
+            # Если нет результатов с порогом, используем топ векторного поиска
             if not final_results and results:
                 print(f"Не найдено результатов с порогом {score_threshold}, используем топ результаты")
                 for result in results[:limit]:
-                    final_results.append({
-                        "text": result.payload.get("text", ""),
-                        "score": result.score,
-                        "metadata": {k: v for k, v in result.payload.items() if k != "text"}
-                    })
+                    final_results.append({**self._to_result(result.payload, result.score), "dense_score": result.score})
             
+            RETRIEVAL_RESULTS.observe(len(final_results))
             return final_results
         except Exception as e:
+            record_error("retrieval", e)
             print(f"Error searching knowledge base: {e}")
             import traceback
             traceback.print_exc()
             return []
     
-    def delete_document(self, document_id: int) -> bool:
+    async def delete_document(self, document_id: int) -> bool:
         """Удалить документ из базы знаний"""
         try:
             # Находим все точки с этим document_id
-            scroll_result = self.qdrant_client.scroll(
+            scroll_result = await self.async_qdrant_client.scroll(
                 collection_name=self.collection_name,
                 scroll_filter={
                     "must": [{
@@ -175,7 +382,7 @@ class KnowledgeService:
             # Удаляем точки
             if scroll_result[0]:
                 point_ids = [point.id for point in scroll_result[0]]
-                self.qdrant_client.delete(
+                await self.async_qdrant_client.delete(
                     collection_name=self.collection_name,
                     points_selector=point_ids
                 )
@@ -183,5 +390,7 @@ class KnowledgeService:
         except Exception as e:
             print(f"Error deleting document from knowledge base: {e}")
             return False
+        finally:
+            await self._bump_kb_version()
 
 knowledge_service = KnowledgeService()
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Mapping, Optional
+from app.core.config import settings
+from app.utils.rate_limit import TokenBucket, backoff_delay, parse_duration, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+class RateLimitRejected(Exception):
+    """Запрос не дождался лимита OpenAI (очередь переполнена или истекло время ожидания)"""
+
+class OpenAIGovernor:
+    """
+    Общий для воркера регулятор запросов к OpenAI.
+
+    Перед запросом ждет свободного места в двух token bucket (запросы в минуту и
+    токены в минуту по оценке размера промпта) и слота конкурентности. Ожидающие
+    обслуживаются по очереди (FIFO); очередь ограничена по длине и времени ожидания.
+    Заголовки x-ratelimit-* подстраивают корзины под фактический остаток на стороне
+    OpenAI, а 429 с Retry-After приостанавливает выдачу всем ожидающим.
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        max_concurrency: int,
+        queue_max_size: int,
+        queue_max_wait: float,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.queue_max_size = queue_max_size
+        self.queue_max_wait = queue_max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._turn = asyncio.Lock()  # FIFO: корзины проверяет только первый в очереди
+        self._paused_until = 0.0
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int, timeout: Optional[float] = None):
+        """
+        Дождаться разрешения на запрос с оценкой estimated_tokens (промпт + max_tokens)
+        
+        Raises:
+            RateLimitRejected: очередь переполнена или ожидание дольше timeout / queue_max_wait
+        """
+        if self.queue_depth >= self.queue_max_size:
+            self.rejected += 1
+            raise RateLimitRejected("Очередь запросов к OpenAI переполнена")
+        wait_limit = self.queue_max_wait if timeout is None else min(timeout, self.queue_max_wait)
+        self.queue_depth += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._admit(estimated_tokens), timeout=max(0.0, wait_limit))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RateLimitRejected(f"Лимит OpenAI не освободился за {wait_limit:.1f} с")
+        finally:
+            self.queue_depth -= 1
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            self.throttled += 1
+            self.throttle_seconds += waited
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    async def _admit(self, estimated_tokens: int):
+        async with self._turn:
+            while True:
+                wait = max(
+                    self._paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens)
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.consume(1)
+            self.tokens.consume(estimated_tokens)
+        if self._slots is not None:
+            try:
+                await self._slots.acquire()
+            except asyncio.CancelledError:
+                # Место в корзинах уже занято, но запрос не состоится
+                self.requests.refund(1)
+                self.tokens.refund(estimated_tokens)
+                raise
+
+    def settle(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """Поправить корзину токенов по фактическому usage ответа"""
+        if used_tokens is None:
+            return
+        difference = estimated_tokens - used_tokens
+        if difference > 0:
+            self.tokens.refund(difference)
+        elif difference < 0:
+            self.tokens.consume(-difference)
+
+    def observe(self, headers: Mapping[str, str]):
+        """Учесть остаток лимитов из заголовков x-ratelimit-* ответа OpenAI"""
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            bucket.limit_to(remaining)
+            if remaining <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.pause(reset)
+
+    def pause(self, seconds: float):
+        """Не выдавать разрешения seconds секунд (всем ожидающим)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @staticmethod
+    def should_retry(status_code: int) -> bool:
+        return status_code == 429 or status_code >= 500
+
+    def retry_delay(self, status_code: int, headers: Mapping[str, str], attempt: int) -> float:
+        """Пауза перед повтором: Retry-After, если OpenAI его прислал, иначе backoff с jitter"""
+        self.retries += 1
+        delay = parse_retry_after(headers)
+        if delay is None:
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+        if status_code == 429:
+            self.rate_limited += 1
+            self.pause(delay)
+            logger.warning(f"OpenAI вернул 429, пауза {delay:.2f} с")
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_max_size": self.queue_max_size,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+            "throttle_seconds": round(self.throttle_seconds, 3),
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "requests_available": None if self.requests.unlimited else round(self.requests.level, 1),
+            "tokens_available": None if self.tokens.unlimited else round(self.tokens.level),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
+
+openai_governor = OpenAIGovernor(
+    rpm=settings.openai_rpm_limit,
+    tpm=settings.openai_tpm_limit,
+    max_concurrency=settings.openai_max_concurrency,
+    queue_max_size=settings.openai_queue_max_size,
+    queue_max_wait=settings.openai_queue_max_wait,
+    max_retries=settings.openai_max_retries,
+    backoff_base=settings.openai_backoff_base,
+    backoff_max=settings.openai_backoff_max
+)
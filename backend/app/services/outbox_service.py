@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import BITRIX_SECONDS, record_error
+from app.db.database import AsyncSessionLocal
+from app.models.db_models import Contact, CrmOutbox
+from app.services.ai_service import ai_service
+from app.services.bitrix24_service import bitrix24_service
+from app.services.history_service import build_conversation_history, build_summary_message, history_service
+from app.utils.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+class OutboxService:
+    """
+    Outbox для отправки лидов в Bitrix24.
+
+    Чат только записывает задачу в crm_outbox в той же транзакции, что и сообщения,
+    а резюме диалога и создание лида выполняет фоновый воркер с повторами и backoff.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    async def enqueue_lead(self, db: AsyncSession, contact_id: int, session_id: str):
+        """Добавить задачу создания лида (повторная постановка того же контакта игнорируется)"""
+        if not bitrix24_service.enabled:
+            logger.warning("Bitrix24 интеграция отключена. Лид не создан.")
+            return
+        await db.execute(
+            pg_insert(CrmOutbox)
+            .values(
+                dedup_key=f"lead:contact:{contact_id}",
+                contact_id=contact_id,
+                session_id=session_id,
+                status=STATUS_PENDING
+            )
+            .on_conflict_do_nothing(index_elements=["dedup_key"])
+        )
+
+    def notify(self):
+        """Разбудить воркер сразу после коммита новой задачи"""
+        self._wakeup.set()
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=10.0)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    async def _run(self):
+        logger.info("Воркер outbox Bitrix24 запущен")
+        while not self._stopping:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Ошибка воркера outbox: {e}", exc_info=True)
+                processed = 0
+            if processed or self._stopping:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.crm_outbox_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> list[int]:
+        """Забрать готовые задачи: статус processing и аренда на lease_seconds"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(CrmOutbox)
+                .where(
+                    CrmOutbox.status.in_([STATUS_PENDING, STATUS_PROCESSING]),
+                    CrmOutbox.next_attempt_at <= func.now()
+                )
+                .order_by(CrmOutbox.id)
+                .limit(settings.crm_outbox_batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            jobs = result.scalars().all()
+            lease_until = datetime.now(timezone.utc) + timedelta(seconds=settings.crm_outbox_lease_seconds)
+            for job in jobs:
+                job.status = STATUS_PROCESSING
+                job.next_attempt_at = lease_until
+            await db.commit()
+            return [job.id for job in jobs]
+
+    async def process_batch(self) -> int:
+        job_ids = await self._claim()
+        for job_id in job_ids:
+            await self._process(job_id)
+        return len(job_ids)
+
+    async def _process(self, job_id: int):
+        # Задача должна завершиться до конца аренды, иначе ее заберет другой воркер
+        deadline = Deadline(settings.crm_outbox_lease_seconds * 0.8)
+        async with AsyncSessionLocal() as db:
+            job = await db.get(CrmOutbox, job_id)
+            if job is None or job.status != STATUS_PROCESSING:
+                return
+            job.attempts += 1
+
+            contact = await db.get(Contact, job.contact_id)
+            if contact is None or not (contact.name and contact.phone):
+                job.status = STATUS_FAILED
+                job.last_error = "Контакт не найден или не заполнен"
+                await db.commit()
+                return
+
+            try:
+                # Резюме не может занять время, нужное на сам запрос к Bitrix24
+                comments = await self._build_comments(
+                    db, job.session_id, deadline.shrink(settings.bitrix24_timeout)
+                )
+                with BITRIX_SECONDS.time():
+                    result = await bitrix24_service.create_lead(
+                        name=contact.name,
+                        phone=contact.phone,
+                        comments=comments,
+                        timeout=max(1.0, deadline.budget(cap=settings.bitrix24_timeout))
+                    )
+            except Exception as e:
+                record_error("bitrix", e)
+                logger.error(f"Ошибка при отправке контакта в Bitrix24: {str(e)}", exc_info=True)
+                result = {"success": False, "error": str(e)}
+
+            if result.get("success"):
+                job.status = STATUS_DONE
+                job.lead_id = str(result.get("lead_id"))
+                job.last_error = None
+                logger.info(f"Контакт {contact.name} ({contact.phone}) успешно отправлен в Bitrix24 (Lead ID: {job.lead_id})")
+            else:
+                job.last_error = str(result.get("error"))
+                if job.attempts >= settings.crm_outbox_max_attempts:
+                    job.status = STATUS_FAILED
+                    logger.error(f"Лид для контакта {contact.id} не создан после {job.attempts} попыток: {job.last_error}")
+                else:
+                    job.status = STATUS_PENDING
+                    job.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=self._backoff(job.attempts))
+                    logger.warning(f"Не удалось отправить контакт в Bitrix24 (попытка {job.attempts}): {job.last_error}")
+            await db.commit()
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        """Экспоненциальная задержка с jitter"""
+        delay = min(settings.crm_outbox_backoff_max, settings.crm_outbox_backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _build_comments(self, db: AsyncSession, session_id: str, deadline: Deadline) -> str:
+        """Комментарий к лиду с кратким резюме диалога (без резюме, если оно не успевает к deadline)"""
+        conversation_summary = ""
+        if session_id:
+            messages, summary = await history_service.load(db, session_id)
+            summary_message = build_summary_message(summary.summary if summary else "")
+            summary_history = ([summary_message] if summary_message else []) + build_conversation_history(messages)
+            conversation_summary = await ai_service.generate_conversation_summary(summary_history, deadline=deadline)
+
+        if conversation_summary:
+            return f"Краткое резюме диалога:\n{conversation_summary}\n\nSession ID: {session_id}"
+        # Если резюме нет (диалог только начался), просто указываем Session ID
+        return f"Контакт создан из AI Chat Widget. Session ID: {session_id}"
+
+    async def get_stats(self, db: AsyncSession) -> dict:
+        """Количество задач по статусам"""
+        result = await db.execute(select(CrmOutbox.status, func.count()).group_by(CrmOutbox.status))
+        counts = {status: 0 for status in (STATUS_PENDING, STATUS_PROCESSING, STATUS_DONE, STATUS_FAILED)}
+        counts.update({status: count for status, count in result.all()})
+        return counts
+
+outbox_service = OutboxService()
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from app.core.config import settings
+from app.core.metrics import RERANK_SECONDS, record_error
+from app.utils.cache import LRUCache
+from app.utils.timing import request_stage
+
+class Reranker:
+    """
+    Переранжирование кандидатов поиска cross-encoder'ом на CPU.
+
+    Модель оценивает пары (запрос, фрагмент) батчами в отдельном пуле потоков;
+    результат кэшируется по (модель, запрос, версия базы знаний), поэтому изменение
+    базы знаний само делает старые записи недостижимыми. Если модель не успевает за
+    rerank_timeout, возвращаются первые кандидаты в исходном порядке.
+
+    Начатое моделью оценивание нельзя прервать, поэтому задачи в пуле ограничены
+    rerank_max_pending: пока пул занят (в том числе брошенными по таймауту задачами),
+    новые запросы не встают в очередь за ними и получают порядок поиска.
+    """
+
+    def __init__(self):
+        self.enabled = settings.rerank_enabled
+        self.model_name = settings.rerank_model
+        self.model = None  # Ленивая загрузка
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        # Освобождается из потока пула, когда задача завершена или отменена до начала
+        self._slots = threading.BoundedSemaphore(max(1, settings.rerank_max_pending))
+        self.cache = LRUCache(maxsize=settings.rerank_cache_size, ttl=settings.rerank_cache_ttl)
+        self.timeouts = 0
+        self.skipped = 0
+
+    def _cache_key(self, query: str, kb_version: int) -> tuple:
+        return (self.model_name, query.lower().strip(), kb_version)
+
+    def lookup(self, query: str, kb_version: int):
+        """Переранжированный список из кэша (None - нужно искать)"""
+        if not self.cache.enabled or self._cache_key(query, kb_version) not in self.cache:
+            return None
+        return self.cache.get(self._cache_key(query, kb_version))
+
+    def _get_model(self):
+        if self.model is None:
+            with self._model_lock:
+                if self.model is None:
+                    from sentence_transformers import CrossEncoder
+                    print(f"Загрузка модели переранжирования {self.model_name}...")
+                    self.model = CrossEncoder(self.model_name, max_length=512, device="cpu")
+                    print("Модель переранжирования загружена")
+        return self.model
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        pairs = [(query, text) for text in texts]
+        scores = self._get_model().predict(pairs, batch_size=settings.rerank_batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
+
+    @staticmethod
+    def _search_order(candidates: list, top_k: int, score_threshold: float) -> list:
+        """Первые кандидаты в порядке поиска с порогом векторного поиска (лексические совпадения проходят)"""
+        relevant = [c for c in candidates if "lexical_score" in c or c.get("dense_score", 0.0) >= score_threshold]
+        return relevant[:top_k]
+
+    async def rerank(self, query: str, candidates: list, kb_version: int, fallback_threshold: float = 0.0) -> list:
+        """
+        Лучшие rerank_top_k кандидатов по оценке cross-encoder (не ниже rerank_score_threshold)
+
+        fallback_threshold - порог векторного поиска для порядка поиска, если модель не применялась.
+        """
+        top_k = settings.rerank_top_k
+        if not candidates:
+            return []
+
+        cache_key = self._cache_key(query, kb_version)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if not self._slots.acquire(blocking=False):
+            self.skipped += 1
+            return self._search_order(candidates, top_k, fallback_threshold)
+        try:
+            job = self._executor.submit(self._score, query, [c["text"] for c in candidates])
+        except Exception as e:
+            self._slots.release()
+            record_error("rerank", e)
+            return self._search_order(candidates, top_k, fallback_threshold)
+        job.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            with RERANK_SECONDS.time(), request_stage("rerank"):
+                scores = await asyncio.wait_for(asyncio.wrap_future(job), timeout=settings.rerank_timeout)
+        except asyncio.TimeoutError as e:
+            # Не кэшируем: следующий такой же запрос может успеть
+            self.timeouts += 1
+            record_error("rerank", e)
+            print(f"Переранжирование дольше {settings.rerank_timeout} с, используется порядок поиска")
+            return self._search_order(candidates, top_k, fallback_threshold)
+        except Exception as e:
+            record_error("rerank", e)
+            print(f"Error reranking search results: {e}")
+            return self._search_order(candidates, top_k, fallback_threshold)
+
+        # score - оценка модели (0..1), исходная оценка поиска сохраняется в search_score
+        ranked = sorted(zip(candidates, scores), key=lambda item: item[1], reverse=True)
+        results = [
+            {**candidate, "score": score, "search_score": candidate.get("score")}
+            for candidate, score in ranked
+            if score >= settings.rerank_score_threshold
+        ][:top_k]
+        self.cache.set(cache_key, results)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "timeouts": self.timeouts,
+            "skipped_busy": self.skipped,
+            **self.cache.stats()
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+reranker = Reranker()
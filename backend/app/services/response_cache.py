@@ -0,0 +1,95 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from app.core.config import settings
+
+class SemanticResponseCache:
+    """
+    Семантический кэш ответов ИИ для FAQ-вопросов.
+
+    Ответ хранится вместе с эмбеддингом вопроса и версией базы знаний.
+    Новый вопрос получает сохраненный ответ, если косинусная близость к
+    сохраненному вопросу не ниже порога и база знаний с тех пор не менялась.
+    """
+
+    def __init__(self, enabled: bool, maxsize: int, similarity_threshold: float, ttl: Optional[float] = None):
+        self.enabled = enabled and maxsize > 0
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl if ttl and ttl > 0 else None
+        # id -> (нормированный эмбеддинг, ответ, версия базы знаний, время истечения)
+        self._entries: "OrderedDict[str, tuple[np.ndarray, str, int, Optional[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge(self, kb_version: int):
+        """Удалить записи устаревшей версии базы знаний и с истекшим TTL"""
+        now = time.monotonic()
+        stale = [
+            key for key, (_, _, version, expires_at) in self._entries.items()
+            if version != kb_version or (expires_at is not None and expires_at <= now)
+        ]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def lookup(self, embedding: List[float], kb_version: int) -> Optional[str]:
+        """Найти ответ на близкий вопрос для текущей версии базы знаний"""
+        if not self.enabled:
+            return None
+        self._purge(kb_version)
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        keys = list(self._entries.keys())
+        matrix = np.stack([self._entries[key][0] for key in keys])
+        similarities = matrix @ self._normalize(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(keys[best])
+        self.hits += 1
+        return self._entries[keys[best]][1]
+
+    def store(self, embedding: List[float], answer: str, kb_version: int):
+        if not self.enabled or not answer:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[str(uuid.uuid4())] = (self._normalize(embedding), answer, kb_version, expires_at)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+response_cache = SemanticResponseCache(
+    enabled=settings.response_cache_enabled,
+    maxsize=settings.response_cache_size,
+    similarity_threshold=settings.response_cache_similarity_threshold,
+    ttl=settings.response_cache_ttl
+)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from sqlalchemy import text
+from app.core.config import settings
+from app.db.database import engine
+from app.utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+class SessionBusyError(Exception):
+    """Не удалось дождаться окончания предыдущего хода сессии"""
+
+class SessionLockManager:
+    """
+    Последовательная обработка ходов одной сессии.
+
+    Внутри воркера ходы упорядочивает asyncio.Lock по session_id. При нескольких
+    воркерах (session_lock_backend = postgres) дополнительно берется транзакционный
+    advisory lock PostgreSQL; на время хода он держит одно соединение из пула.
+    """
+
+    def __init__(self, backend: str, timeout: float):
+        if backend not in ("memory", "postgres"):
+            raise ValueError(f"Неизвестный бэкенд блокировки сессий: {backend}")
+        self.backend = backend
+        self.timeout = timeout
+        # session_id -> [lock, число владельцев и ожидающих]; запись удаляется, когда она никому не нужна
+        self._locks: dict = {}
+        self.waits = 0
+        self.timeouts = 0
+
+    @asynccontextmanager
+    async def hold(self, session_id: str, timeout: Optional[float] = None):
+        """Дождаться своей очереди (не дольше timeout, по умолчанию session_lock_timeout)"""
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            lock = entry[0]
+            if lock.locked():
+                self.waits += 1
+            try:
+                await asyncio.wait_for(lock.acquire(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise SessionBusyError(session_id)
+            try:
+                if self.backend == "postgres":
+                    async with self._advisory_lock(session_id, max(0.0, deadline - loop.time())):
+                        yield
+                else:
+                    yield
+            finally:
+                lock.release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(session_id, None)
+
+    @asynccontextmanager
+    async def _advisory_lock(self, session_id: str, timeout: float):
+        """pg_advisory_xact_lock снимается вместе с транзакцией, в том числе при обрыве соединения"""
+        timeout_ms = max(1, int(timeout * 1000))
+        async with engine.connect() as conn:
+            async with conn.begin():
+                # Ожидание блокировки ограничено оставшимся временем, а не общим statement_timeout
+                await conn.execute(text(f"SET LOCAL lock_timeout = {timeout_ms}"))
+                await conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms + 1000}"))
+                try:
+                    await conn.execute(
+                        text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))"),
+                        {"key": f"chat_session:{session_id}"}
+                    )
+                except Exception as e:
+                    self.timeouts += 1
+                    logger.warning(f"Не удалось получить advisory lock сессии {session_id}: {e}")
+                    raise SessionBusyError(session_id) from e
+                yield
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "active_sessions": len(self._locks),
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+        }
+
+session_lock = SessionLockManager(
+    backend=settings.session_lock_backend,
+    timeout=settings.session_lock_timeout
+)
+
+# Одинаковые одновременные ходы (та же сессия и тот же текст, например двойная отправка)
+# получают один ответ ИИ вместо повторного вызова; ключ - (session_id, текст сообщения)
+inflight_turns = SingleFlight()
@@ -0,0 +1,110 @@
+import itertools
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from app.core.config import settings
+from app.utils.cache import LRUCache
+
+@dataclass
+class ContactSnapshot:
+    """Данные контакта, нужные на ходе диалога (без привязки к сессии SQLAlchemy)"""
+    id: int
+    name: Optional[str] = None
+    phone: Optional[str] = None
+
+    @classmethod
+    def from_contact(cls, contact) -> Optional["ContactSnapshot"]:
+        if contact is None:
+            return None
+        return cls(id=contact.id, name=contact.name, phone=contact.phone)
+
+@dataclass
+class HistoryMessage:
+    """Обмен репликами из истории (без привязки к сессии SQLAlchemy)"""
+    id: int
+    message: Optional[str] = None
+    response: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, msg) -> "HistoryMessage":
+        return cls(id=msg.id, message=msg.message, response=msg.response)
+
+@dataclass
+class SessionState:
+    """Состояние сессии чата: контакт, резюме свернутой части и несвернутые сообщения"""
+    contact: Optional[ContactSnapshot] = None
+    summary: str = ""
+    messages: List[HistoryMessage] = field(default_factory=list)
+    # Поколение сессии в хранилище на момент чтения из БД (см. SessionStateStore.generation)
+    generation: int = 0
+    # (id последнего сообщения, last_message_id резюме) в БД - по ним попадание сверяется с БД
+    db_version: Tuple[int, int] = (0, 0)
+
+class SessionStateStore(ABC):
+    """
+    Хранилище состояния сессий.
+
+    Интерфейс асинхронный, чтобы общий бэкенд (например, Redis при нескольких
+    воркерах) можно было подключить отдельной реализацией; состояние - dataclass,
+    поэтому сериализуется через dataclasses.asdict.
+
+    invalidate меняет поколение сессии, а set не записывает состояние, прочитанное
+    в другом поколении: ход, начатый до сворачивания истории, не вернет в кэш
+    уже свернутые сообщения.
+    """
+
+    @abstractmethod
+    async def generation(self, session_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[SessionState]:
+        ...
+
+    @abstractmethod
+    async def set(self, session_id: str, state: SessionState):
+        ...
+
+    @abstractmethod
+    async def invalidate(self, session_id: str):
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+class InMemorySessionStateStore(SessionStateStore):
+    """In-process LRU кэш с TTL (состояние видно только текущему воркеру)"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float]):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        # Без TTL: поколение должно пережить запись состояния; вытесненное считается нулевым
+        self._generations = LRUCache(maxsize=maxsize)
+        self._counter = itertools.count(1)
+
+    async def generation(self, session_id: str) -> int:
+        return self._generations.get(session_id, 0)
+
+    async def get(self, session_id: str) -> Optional[SessionState]:
+        return self._cache.get(session_id)
+
+    async def set(self, session_id: str, state: SessionState):
+        if state.generation != self._generations.get(session_id, 0):
+            return  # Состояние прочитано до invalidate - устарело
+        self._cache.set(session_id, state)
+
+    async def invalidate(self, session_id: str):
+        self._cache.pop(session_id)
+        self._generations.set(session_id, next(self._counter))
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+def create_session_state_store() -> SessionStateStore:
+    if settings.session_state_backend == "memory":
+        return InMemorySessionStateStore(
+            maxsize=settings.session_state_cache_size,
+            ttl=settings.session_state_ttl
+        )
+    raise ValueError(f"Неизвестный бэкенд состояния сессий: {settings.session_state_backend}")
+
+session_state_store = create_session_state_store()
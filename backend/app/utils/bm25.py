@@ -0,0 +1,113 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Hashable, Iterable, List
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+STOPWORDS = frozenset(
+    "и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было "
+    "вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас "
+    "нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их "
+    "чем была сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой "
+    "совсем ним здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при "
+    "наконец два об другой хоть после над больше тот через эти нас про всего них какая много разве три "
+    "эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда конечно "
+    "всю между это такая такое также "
+    "a an the and or of to in on at for is are was were be by with as it this that from who what how".split()
+)
+
+# Окончания для легкого стемминга русских слов (самые длинные проверяются первыми)
+RUSSIAN_ENDINGS = sorted(
+    (
+        "иями ями ами ией иям ием иях ого его ому ему ими ыми ешь ете ите ишь ить ать ять еть уть "
+        "ться тся ает яет ует ают яют уют ала ила ыла ела али или ыли ели ало ило ыло ело "
+        "ов ев ей ам ям ах ях ом ем ью ия ья ие ье ии ий ый ой ая яя ое ее ые ую юю ых их ым им ет ит "
+        "ут ют ат ят ал ил ыл ел ла ли ло "
+        "а я о е ы и у ю ь й"
+    ).split(),
+    key=len,
+    reverse=True
+)
+MIN_STEM_LENGTH = 3
+
+def stem(token: str) -> str:
+    """Легкий стемминг: отрезает типичное окончание русского слова (латиница и числа без изменений)"""
+    if len(token) <= MIN_STEM_LENGTH + 1 or not CYRILLIC_RE.search(token):
+        return token
+    for ending in RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+            return token[:-len(ending)]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    """Токены для лексического поиска: нижний регистр, ё -> е, без стоп-слов, со стеммингом"""
+    tokens = TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    return [stem(token) for token in tokens if token not in STOPWORDS]
+
+class BM25Index:
+    """
+    Неизменяемый лексический индекс BM25 (Okapi) по набору текстов.
+
+    Строится целиком из (ключ, текст); обновление - построение нового индекса.
+    """
+
+    def __init__(self, documents: Iterable[tuple[Hashable, str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.keys: list = []
+        self._lengths: List[int] = []
+        # термин -> [(номер документа, частота термина)]
+        self._postings: dict = {}
+        for key, text in documents:
+            doc_index = len(self.keys)
+            tokens = tokenize(text)
+            self.keys.append(key)
+            self._lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((doc_index, frequency))
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _idf(self, document_frequency: int) -> float:
+        total = len(self.keys)
+        return math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query: str, limit: int) -> List[tuple[Hashable, float]]:
+        """Лучшие документы для запроса: [(ключ, score)] по убыванию score"""
+        if not self.keys or limit <= 0:
+            return []
+        scores: dict = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(len(postings))
+            for doc_index, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_index] / self._avg_length)
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(self.keys[doc_index], score) for doc_index, score in best]
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self.keys),
+            "terms": len(self._postings),
+            "avg_length": round(self._avg_length, 1),
+        }
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Hashable]], k: int = 60) -> List[tuple[Hashable, float]]:
+    """
+    Слияние ранжированных списков (Reciprocal Rank Fusion): score = сумма 1 / (k + позиция)
+
+    Учитывает только позиции, поэтому несопоставимые шкалы (косинус и BM25) не нужно нормировать.
+    """
+    scores: dict = {}
+    for ranking in rankings:
+        for position, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + position)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
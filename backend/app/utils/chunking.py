@@ -0,0 +1,46 @@
+from typing import Callable
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Границы разбиения от крупных к мелким: абзац, строка, конец предложения, знаки внутри
+# предложения, слово. Разделитель - пробелы после знака, сам знак остается в предложении
+CHUNK_SEPARATORS = [
+    r"\n\s*\n",
+    r"\n",
+    r"(?<=[.!?…])\s+",
+    r"(?<=[;:,])\s+",
+    r"\s+",
+    "",
+]
+
+# [CLS] и [SEP], которые модель добавляет к каждому тексту
+SPECIAL_TOKENS = 2
+
+def load_tokenizer(model_name: str):
+    """Токенизатор модели эмбеддингов (тот же, что обрезает вход модели)"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+def token_length_function(tokenizer) -> Callable[[str], int]:
+    def length(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return length
+
+def effective_chunk_size(chunk_size: int, max_seq_length: int) -> int:
+    """Размер чанка в токенах, который модель кодирует целиком"""
+    return max(1, min(chunk_size, max_seq_length - SPECIAL_TOKENS))
+
+def build_text_splitter(tokenizer, chunk_size: int, chunk_overlap: int, max_seq_length: int) -> RecursiveCharacterTextSplitter:
+    """
+    Разбиение по токенам модели эмбеддингов с учетом границ абзацев и предложений
+
+    Размер чанка ограничен лимитом модели, иначе хвост чанка не попадет в эмбеддинг.
+    """
+    chunk_size = effective_chunk_size(chunk_size, max_seq_length)
+    return RecursiveCharacterTextSplitter(
+        separators=CHUNK_SEPARATORS,
+        is_separator_regex=True,
+        keep_separator=True,
+        chunk_size=chunk_size,
+        chunk_overlap=min(chunk_overlap, chunk_size // 2),
+        length_function=token_length_function(tokenizer),
+    )
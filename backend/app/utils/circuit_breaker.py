@@ -0,0 +1,57 @@
+import time
+
+class CircuitBreaker:
+    """
+    Circuit breaker для ненадежного сетевого пути (например, прокси).
+
+    После failure_threshold ошибок подряд путь считается неработающим и
+    пропускается cooldown_seconds секунд. По истечении паузы пропускается
+    одна пробная попытка: успех закрывает breaker, ошибка снова открывает его.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, cooldown_seconds: float = 60.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли сейчас использовать путь"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # HALF_OPEN: пропускаем только одну пробную попытку за раз
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def release(self):
+        """
+        Завершить пробную попытку без вывода о пути (ошибка не связана с сетью)
+
+        Вызывается после каждой попытки; если исход уже записан, ничего не меняет.
+        """
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
@@ -0,0 +1,67 @@
+import asyncio
+import math
+import time
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени запроса исчерпан"""
+
+class Deadline:
+    """
+    Момент, к которому запрос должен быть обработан.
+
+    Передается через стадии запроса: каждая стадия берет не больше оставшегося
+    бюджета (и не больше своего собственного лимита).
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default: float, maximum: float) -> "Deadline":
+        """Бюджет из заголовка клиента (секунды), ограниченный сверху maximum"""
+        try:
+            timeout = float(value) if value else default
+        except ValueError:
+            timeout = default
+        # nan и inf проходят float(), а min(nan, maximum) дает nan - дедлайн истек бы сразу
+        if not math.isfinite(timeout) or timeout <= 0:
+            timeout = default
+        return cls(min(timeout, maximum))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Сколько может занять стадия: остаток минус reserve для следующих стадий, не больше cap"""
+        budget = self.remaining() - reserve
+        if cap is not None:
+            budget = min(budget, cap)
+        return max(0.0, budget)
+
+    def shrink(self, reserve: float) -> "Deadline":
+        """Более ранний дедлайн: reserve секунд остаются последующим стадиям"""
+        deadline = Deadline.__new__(Deadline)
+        deadline.timeout = self.timeout
+        deadline.expires_at = self.expires_at - reserve
+        return deadline
+
+    async def run(self, awaitable: Awaitable[T], cap: Optional[float] = None, reserve: float = 0.0) -> T:
+        """Выполнить стадию в пределах бюджета; по его истечении - DeadlineExceeded"""
+        budget = self.budget(cap, reserve)
+        if budget <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            elif isinstance(awaitable, asyncio.Future):
+                awaitable.cancel()
+            raise DeadlineExceeded()
+        try:
+            return await asyncio.wait_for(awaitable, timeout=budget)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded()
@@ -0,0 +1,81 @@
+import json
+import re
+
+class JsonStringFieldExtractor:
+    """
+    Инкрементальное извлечение строкового поля из частично сгенерированного JSON.
+
+    ИИ отвечает объектом {"response": "...", "name": "...", "phone": "..."}.
+    При потоковой генерации JSON приходит кусками, поэтому текст поля "response"
+    декодируется по мере поступления токенов, не дожидаясь конца объекта.
+    """
+
+    def __init__(self, field: str = "response"):
+        self._key_pattern = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._pos = 0
+        self._in_value = False
+        self.done = False
+        self.value = ""
+
+    def feed(self, chunk: str) -> str:
+        """Добавить кусок JSON и вернуть новую декодированную часть значения поля"""
+        if self.done or not chunk:
+            return ""
+        self._buffer += chunk
+
+        if not self._in_value:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._in_value = True
+            self._pos = match.end()
+
+        decoded = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if char == '"':
+                self.done = True
+                self._pos += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                self._pos += 1
+                continue
+
+            # Escape-последовательность: ждем, пока она придет целиком
+            escape = self._read_escape(buffer, self._pos)
+            if escape is None:
+                break
+            text, length = escape
+            decoded.append(text)
+            self._pos += length
+
+        new_text = "".join(decoded)
+        self.value += new_text
+        return new_text
+
+    @staticmethod
+    def _read_escape(buffer: str, pos: int):
+        """Декодировать escape-последовательность; None если она еще не пришла целиком"""
+        if pos + 1 >= len(buffer):
+            return None
+        if buffer[pos + 1] != "u":
+            sequence = buffer[pos:pos + 2]
+        else:
+            if pos + 6 > len(buffer):
+                return None
+            sequence = buffer[pos:pos + 6]
+            code = int(sequence[2:], 16) if re.fullmatch(r"[0-9a-fA-F]{4}", sequence[2:]) else None
+            # Суррогатная пара (эмодзи и т.п.) декодируется только вместе со второй половиной
+            if code is not None and 0xD800 <= code <= 0xDBFF:
+                if pos + 12 > len(buffer):
+                    return None
+                if buffer[pos + 6:pos + 8] == "\\u":
+                    sequence = buffer[pos:pos + 12]
+        try:
+            return json.loads('"' + sequence + '"'), len(sequence)
+        except json.JSONDecodeError:
+            # Некорректный escape - отдаем как есть, чтобы не зависнуть на нем
+            return sequence, len(sequence)
@@ -0,0 +1,91 @@
+import random
+import re
+import time
+from typing import Mapping, Optional
+
+class TokenBucket:
+    """
+    Token bucket: емкость capacity, пополнение capacity единиц за period секунд.
+
+    capacity <= 0 - без ограничения.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period if capacity > 0 else 0.0
+        self.level = float(capacity)
+        self._updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Через сколько секунд в корзине наберется amount (0 - уже есть)"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        if self.unlimited:
+            return
+        self._refill()
+        # Уровень может уйти в минус: крупный запрос или недооценка оплачиваются ожиданием следующих
+        self.level -= amount
+
+    def refund(self, amount: float):
+        if self.unlimited:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def limit_to(self, available: float):
+        """Синхронизация с остатком, который сообщил сервер (он учитывает и другие процессы)"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.level = min(self.level, available)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Длительность в формате заголовков x-ratelimit-reset-* ("20ms", "1.5s", "6m0s") в секундах"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Пауза из retry-after-ms / Retry-After (секунды); дата в Retry-After не поддерживается"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Экспоненциальная задержка с jitter для попытки attempt (с нуля)"""
+    return min(maximum, base * 2 ** attempt) * random.uniform(0.5, 1.0)
@@ -0,0 +1,70 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+class FlightAborted(Exception):
+    """Ведущий вызов прерван (отмена, разрыв соединения клиента) и не дал результата"""
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных операций.
+
+    Первый вызов с ключом становится ведущим и выполняет работу, остальные
+    вызовы с тем же ключом, пришедшие до ее окончания, ждут и получают тот же
+    результат (или то же исключение). Состояние живет в пределах процесса.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def get(self, key: Hashable) -> Optional[asyncio.Future]:
+        """Future выполняющейся операции с этим ключом (None, если такой нет)"""
+        return self._inflight.get(key)
+
+    async def wait(self, future: asyncio.Future) -> Any:
+        """
+        Дождаться результата ведущего (отмена ожидающего не отменяет работу ведущего)
+        
+        Raises:
+            FlightAborted: ведущий прерван - операцию нужно выполнить заново
+        """
+        self.shared += 1
+        return await asyncio.shield(future)
+
+    @contextmanager
+    def lead(self, key: Hashable):
+        """Зарегистрировать ведущего; результат передается через future.set_result"""
+        future = asyncio.get_running_loop().create_future()
+        # Исключение без ожидающих не должно попадать в лог как "never retrieved"
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = future
+        self.leaders += 1
+        try:
+            yield future
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+                    future.set_exception(FlightAborted())
+                else:
+                    future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            if not future.done():
+                future.set_exception(FlightAborted())
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        while (future := self.get(key)) is not None:
+            try:
+                return await self.wait(future)
+            except FlightAborted:
+                continue
+        with self.lead(key) as future:
+            result = await func()
+            future.set_result(result)
+            return result
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "shared": self.shared}
@@ -0,0 +1,54 @@
+import os
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".doc", ".docx")
+
+def extract_text(file_path: str, filename: str) -> str:
+    """Текст загруженного документа (при ошибке - строка с описанием проблемы)"""
+    file_ext = os.path.splitext(filename)[1]
+    text = ""
+    if file_ext.lower() == '.txt':
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except UnicodeDecodeError:
+            with open(file_path, "r", encoding="windows-1251") as f:
+                text = f.read()
+    elif file_ext.lower() == '.pdf':
+        try:
+            from pypdf import PdfReader
+            reader = PdfReader(file_path)
+            text = "\n".join([page.extract_text() for page in reader.pages])
+        except Exception as e:
+            text = f"Не удалось извлечь текст из PDF: {filename} - {str(e)}"
+    elif file_ext.lower() in ['.doc', '.docx']:
+        try:
+            # Проверяем, что файл существует
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"Файл не найден: {file_path}")
+
+            # Импортируем Document из python-docx с переименованием, чтобы избежать конфликта
+            # с SQLAlchemy моделью Document из app.models.db_models
+            from docx import Document as DocxDocument
+            # Открываем файл напрямую по пути
+            doc = DocxDocument(file_path)
+            paragraphs = []
+            for paragraph in doc.paragraphs:
+                if paragraph.text.strip():
+                    paragraphs.append(paragraph.text)
+            # Также извлекаем текст из таблиц
+            for table in doc.tables:
+                for row in table.rows:
+                    for cell in row.cells:
+                        if cell.text.strip():
+                            paragraphs.append(cell.text)
+            text = "\n".join(paragraphs)
+            if not text.strip():
+                text = f"Документ {filename} не содержит текста"
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            print(f"DOCX error for {filename}: {error_details}")
+            text = f"Не удалось извлечь текст из DOC/DOCX: {filename} - {str(e)}"
+    else:
+        text = f"Формат {file_ext} пока не поддерживается"
+    return text
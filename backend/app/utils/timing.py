@@ -0,0 +1,66 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class StageTimings:
+    """
+    Длительность стадий обработки запроса (мс).
+
+    Стадии могут выполняться параллельно, поэтому сумма стадий бывает больше
+    общего времени запроса. Повторный замер той же стадии суммируется.
+    """
+
+    def __init__(self):
+        self.stages: dict = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    async def measure(self, name: str, awaitable: Awaitable[T]) -> T:
+        with self.stage(name):
+            return await awaitable
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def summary(self) -> str:
+        parts = [f"{name}={ms:.1f}ms" for name, ms in self.stages.items()]
+        parts.append(f"total={self.total_ms():.1f}ms")
+        return " ".join(parts)
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
+
+# Замеры текущего HTTP-запроса (устанавливает ServerTimingMiddleware)
+_request_timings: ContextVar[Optional[StageTimings]] = ContextVar("request_timings", default=None)
+
+def start_request_timings() -> StageTimings:
+    timings = StageTimings()
+    _request_timings.set(timings)
+    return timings
+
+def current_timings() -> StageTimings:
+    """Замеры текущего запроса; вне запроса - новый независимый объект"""
+    return _request_timings.get() or StageTimings()
+
+@contextmanager
+def request_stage(name: str):
+    """Замер стадии в замерах текущего запроса (вне запроса ничего не делает)"""
+    timings = _request_timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
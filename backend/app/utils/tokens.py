@@ -0,0 +1,41 @@
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены на каждое сообщение chat completions (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+        # gpt-4o* используют o200k_base; старые версии tiktoken его не знают - берем cl100k_base
+        for name in ("o200k_base", "cl100k_base"):
+            try:
+                return tiktoken.get_encoding(name)
+            except ValueError:
+                continue
+        return None
+    except Exception as e:
+        # tiktoken скачивает словарь при первом использовании - без сети считаем приблизительно
+        logger.warning(f"Токенизатор для {model} недоступен ({e}), используется оценка по длине текста")
+        return None
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Количество токенов в тексте для модели OpenAI"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Для кириллицы в среднем ~3 символа на токен
+        return len(text) // 3 + 1
+    return len(encoding.encode(text))
+
+def count_message_tokens(messages: list, model: str = "gpt-4o-mini") -> int:
+    """Количество токенов в списке сообщений chat completions"""
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+# Тесты запускаются из backend/ или из корня проекта: пакет app должен импортироваться
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKEND_MODULES = (
+    "httpx", "numpy", "pydantic_settings", "prometheus_client", "qdrant_client", "langchain", "langchain_openai",
+    "fastapi", "sqlalchemy", "asyncpg"
+)
+
+@pytest.fixture
+def knowledge_service(monkeypatch):
+    """Сервис базы знаний без обращения к Qdrant при создании (коллекция считается существующей)"""
+    for module in BACKEND_MODULES:
+        pytest.importorskip(module)
+    import qdrant_client
+    monkeypatch.setattr(qdrant_client.QdrantClient, "get_collection", lambda self, collection_name: None)
+    from app.services.knowledge_service import knowledge_service
+    return knowledge_service
+
+@pytest.fixture
+def ai_service(knowledge_service):
+    from app.services.ai_service import ai_service
+    return ai_service
@@ -0,0 +1,76 @@
+"""Ход чата делает ровно один запрос к OpenAI: ответ клиенту и извлечение имени/телефона вместе"""
+import asyncio
+import json
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+KNOWLEDGE_TEXT = "Занятия проходят по субботам с 10:00 до 12:00, стоимость 2000 рублей."
+
+def completion_response(content: dict):
+    import httpx
+    return httpx.Response(
+        200,
+        json={
+            "choices": [{"message": {"content": json.dumps(content, ensure_ascii=False)}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+        },
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    )
+
+def fake_db():
+    """AsyncSession без БД: ход без контактных данных только добавляет строку сообщения"""
+    db = MagicMock()
+    db.commit = AsyncMock()
+    db.execute = AsyncMock()
+    return db
+
+def test_chat_turn_makes_single_completion_call(ai_service, knowledge_service, monkeypatch):
+    import httpx
+    from app.api.chat import chat
+    from app.core.config import settings
+    from app.models.schemas import ChatRequest
+    from app.services.history_service import history_service
+    from app.services.reranker import reranker
+    from app.services.session_state import SessionState
+
+    monkeypatch.setattr(reranker, "enabled", False)
+    search = AsyncMock(return_value=[
+        {"text": KNOWLEDGE_TEXT, "score": 0.82, "metadata": {"document_id": 1, "chunk_index": 0}}
+    ])
+    monkeypatch.setattr(knowledge_service, "search", search)
+    monkeypatch.setattr(knowledge_service, "refresh_kb_version", AsyncMock())
+    # Промах кэша состояния: новая сессия без истории и контакта; второй ход берет состояние из кэша
+    monkeypatch.setattr(settings, "session_state_validate_hits", False)
+    monkeypatch.setattr(history_service, "_load_session_state", AsyncMock(return_value=SessionState()))
+
+    async def run():
+        client = httpx.AsyncClient()
+        post = AsyncMock(return_value=completion_response({
+            "response": "Занятия по субботам с 10:00, стоимость 2000 рублей. Как вас зовут?",
+            "name": "",
+            "phone": ""
+        }))
+        monkeypatch.setattr(client, "post", post)
+        monkeypatch.setattr(ai_service, "_proxy_client", None)
+        monkeypatch.setattr(ai_service, "_direct_client", client)
+        session_id = str(uuid.uuid4())
+        db = fake_db()
+        try:
+            first = await chat(ChatRequest(message="Когда проходят занятия?", session_id=session_id), db=db, x_request_timeout=None)
+            calls_after_first_turn = post.call_count
+            second = await chat(ChatRequest(message="А сколько стоит?", session_id=session_id), db=db, x_request_timeout=None)
+        finally:
+            await client.aclose()
+        return post, calls_after_first_turn, first, second, db
+
+    post, calls_after_first_turn, first, second, db = asyncio.run(run())
+
+    assert calls_after_first_turn == 1
+    assert post.call_count == 2
+    assert first.response.startswith("Занятия по субботам")
+    assert second.session_id == first.session_id
+    assert search.await_count == 2
+    # Найденный фрагмент попал в тот же единственный запрос хода
+    messages = post.call_args_list[0].kwargs["json"]["messages"]
+    assert any(KNOWLEDGE_TEXT in message["content"] for message in messages)
+    assert db.commit.await_count == 2
@@ -0,0 +1,62 @@
+"""Кодирование эмбеддингов выполняется в пуле потоков и не останавливает event loop"""
+import asyncio
+import threading
+import time
+
+# Интервал пульса и допустимая задержка тика при занятой модели (кодирование батча - 0.3 с)
+HEARTBEAT_INTERVAL = 0.01
+MAX_HEARTBEAT_GAP = 0.1
+ENCODE_SECONDS = 0.3
+
+def slow_backend():
+    from app.services.embedding_backends import EmbeddingBackend
+
+    class SlowEmbeddingBackend(EmbeddingBackend):
+        """Блокирующее кодирование, как у настоящей модели на CPU"""
+        name = "slow:test"
+
+        def __init__(self):
+            self.threads = set()
+
+        def embed_documents(self, texts):
+            self.threads.add(threading.current_thread().name)
+            time.sleep(ENCODE_SECONDS)
+            return [[float(len(text))] * 384 for text in texts]
+
+    return SlowEmbeddingBackend()
+
+def test_embeddings_do_not_block_event_loop(knowledge_service, monkeypatch):
+    backend = slow_backend()
+    monkeypatch.setattr(knowledge_service, "embedding_backend", backend)
+
+    async def run():
+        gaps = []
+        stop = asyncio.Event()
+
+        async def heartbeat():
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticker = asyncio.create_task(heartbeat())
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            knowledge_service.embed_query(f"запрос для проверки пульса {time.time_ns()}"),
+            knowledge_service.embed_documents(["первый чанк", "второй чанк"]),
+            knowledge_service.embed_documents(["третий чанк"])
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+        return results, gaps, elapsed
+
+    (query_vector, documents, more_documents), gaps, elapsed = asyncio.run(run())
+
+    assert len(query_vector) == 384
+    assert len(documents) == 2 and len(more_documents) == 1
+    assert elapsed >= ENCODE_SECONDS
+    assert gaps and max(gaps) < MAX_HEARTBEAT_GAP
+    assert backend.threads and all(name.startswith("embedding") for name in backend.threads)
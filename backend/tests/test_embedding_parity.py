@@ -0,0 +1,51 @@
+"""
+Эмбеддинги ONNX-бэкенда (fp32 и int8) совпадают с torch (sentence-transformers).
+
+Корпус и сравнение - из scripts/bench/embedding_parity.py. Тест пропускается, если нет torch
+или экспортированной модели (python scripts/export_onnx_model.py --quantize).
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts", "bench"))
+
+# (квантование, файл модели, минимальная косинусная близость к torch, доля запросов с тем же ближайшим фрагментом)
+VARIANTS = [
+    pytest.param(False, "model.onnx", 0.999, 1.0, id="onnx"),
+    pytest.param(True, "model_int8.onnx", 0.98, 0.875, id="onnx-int8"),
+]
+
+@pytest.fixture(scope="module")
+def torch_reference():
+    for module in ("numpy", "pydantic_settings", "torch", "sentence_transformers", "langchain_community"):
+        pytest.importorskip(module)
+    import embedding_parity
+    from app.core.config import settings
+    from app.services.embedding_backends import TorchEmbeddingBackend
+    return embedding_parity.encode(TorchEmbeddingBackend(embedding_parity.MODEL_NAME, settings.embedding_batch_size))
+
+@pytest.mark.parametrize("quantized, filename, min_cosine, min_agreement", VARIANTS)
+def test_onnx_matches_torch(torch_reference, quantized, filename, min_cosine, min_agreement):
+    for module in ("onnxruntime", "transformers"):
+        pytest.importorskip(module)
+    import numpy as np
+    import embedding_parity
+    from app.core.config import settings
+    from app.services.embedding_backends import OnnxEmbeddingBackend, default_onnx_dir
+
+    model_dir = settings.embedding_onnx_path or default_onnx_dir(embedding_parity.MODEL_NAME)
+    if not os.path.exists(os.path.join(model_dir, filename)):
+        pytest.skip(f"нет {filename} в {model_dir}")
+    backend = OnnxEmbeddingBackend(
+        model_dir, embedding_parity.MODEL_NAME, settings.embedding_batch_size,
+        settings.embedding_max_seq_length, quantized=quantized
+    )
+    candidate = embedding_parity.encode(backend)
+
+    cosines = np.sum(torch_reference["texts"] * candidate["texts"], axis=1)
+    assert float(cosines.min()) >= min_cosine
+    # Ближайший фрагмент корпуса для запросов тот же, что у torch
+    top_reference = np.argmax(torch_reference["queries"] @ torch_reference["corpus"].T, axis=1)
+    top_candidate = np.argmax(candidate["queries"] @ candidate["corpus"].T, axis=1)
+    assert float(np.mean(top_reference == top_candidate)) >= min_agreement
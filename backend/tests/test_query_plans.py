@@ -0,0 +1,43 @@
+"""
+Планы горячих запросов: ни один не читает таблицу последовательным сканированием.
+
+Нужна база PostgreSQL с примененными миграциями (alembic upgrade head), адрес - в TEST_DATABASE_URL.
+Синтетические данные из scripts/bench/check_query_plans.py создаются в транзакции и откатываются.
+"""
+import os
+import sys
+import pytest
+
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts", "bench"))
+
+@pytest.fixture(scope="module")
+def seeded_connection():
+    for module in ("sqlalchemy", "psycopg2", "pydantic_settings"):
+        pytest.importorskip(module)
+    from sqlalchemy import create_engine
+    import check_query_plans
+
+    engine = create_engine(DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"))
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            check_query_plans.seed(conn, sessions=5000, per_session=20)
+            yield conn
+        finally:
+            transaction.rollback()
+    engine.dispose()
+
+def test_hot_queries_use_indexes(seeded_connection):
+    import check_query_plans
+
+    scans = {}
+    for name, statement in check_query_plans.hot_queries().items():
+        found = check_query_plans.seq_scans(check_query_plans.explain(seeded_connection, statement))
+        if found:
+            scans[name] = found
+
+    assert not scans, f"Seq Scan в планах: {scans}"
@@ -4,6 +4,11 @@
     const API_URL = window.API_URL || 'http://localhost:8000';
     const MOCK_MODE = window.MOCK_MODE === true; // По умолчанию выключен
     
+    // Повторы при перегрузке сервера (503)
+    const MAX_RETRIES = 3;
+    const RETRY_BASE_DELAY_MS = 1000;
+    const RETRY_MAX_DELAY_MS = 15000;
+    
     class ChatWidget {
         constructor() {
             this.isOpen = false;
@@ -102,7 +107,7 @@
             }
             
             try {
-                const response = await fetch(`${API_URL}/api/chat`, {
+                const response = await this.fetchWithBackoff(`${API_URL}/api/chat/stream`, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -113,14 +118,43 @@
                     })
                 });
                 
-                const data = await response.json();
-                this.hideTyping();
-                this.addMessage('bot', data.response || 'Извините, произошла ошибка');
+                if (!response.ok || !response.body) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                
+                // Читаем поток Server-Sent Events и показываем ответ по мере генерации
+                let botContent = null;
+                let botText = '';
+                await this.readEventStream(response, (event, data) => {
+                    if (event === 'session' || event === 'done') {
+                        // Сохраняем session_id для следующих запросов
+                        if (data.session_id) {
+                            this.sessionId = data.session_id;
+                            localStorage.setItem('chat_session_id', data.session_id);
+                        }
+                    }
+                    if (event === 'token') {
+                        if (!botContent) {
+                            this.hideTyping();
+                            botContent = this.addMessage('bot', '');
+                        }
+                        botText += data.text;
+                        this.updateMessage(botContent, botText);
+                    } else if (event === 'done') {
+                        // Финальный текст может отличаться от потока (например, при ошибке разбора JSON)
+                        this.hideTyping();
+                        const finalText = data.response || 'Извините, произошла ошибка';
+                        if (botContent) {
+                            this.updateMessage(botContent, finalText);
+                        } else {
+                            botContent = this.addMessage('bot', finalText);
+                        }
+                    }
+                });
                 
-                // Сохраняем session_id для следующих запросов
-                if (data.session_id) {
-                    this.sessionId = data.session_id;
-                    localStorage.setItem('chat_session_id', data.session_id);
+                if (!botContent) {
+                    this.hideTyping();
+                    this.addMessage('bot', 'Извините, произошла ошибка');
                 }
             } catch (error) {
                 this.hideTyping();
@@ -129,6 +163,54 @@
             }
         }
         
+        async fetchWithBackoff(url, options) {
+            // Сервер перегружен (503) - повторяем с паузой из Retry-After или растущей паузой с jitter
+            for (let attempt = 0; ; attempt++) {
+                const response = await fetch(url, options);
+                if (response.status !== 503 || attempt >= MAX_RETRIES) {
+                    return response;
+                }
+                const retryAfter = parseFloat(response.headers.get('Retry-After'));
+                const baseDelay = Number.isFinite(retryAfter)
+                    ? retryAfter * 1000
+                    : RETRY_BASE_DELAY_MS * Math.pow(2, attempt);
+                const delay = Math.min(RETRY_MAX_DELAY_MS, baseDelay) * (0.75 + Math.random() * 0.5);
+                await new Promise((resolve) => setTimeout(resolve, delay));
+            }
+        }
+        
+        async readEventStream(response, onEvent) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder('utf-8');
+            let buffer = '';
+            
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                
+                // События разделяются пустой строкой
+                let separatorIndex;
+                while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, separatorIndex);
+                    buffer = buffer.slice(separatorIndex + 2);
+                    
+                    let event = 'message';
+                    const dataLines = [];
+                    rawEvent.split('\n').forEach((line) => {
+                        if (line.startsWith('event:')) {
+                            event = line.slice(6).trim();
+                        } else if (line.startsWith('data:')) {
+                            dataLines.push(line.slice(5).trim());
+                        }
+                    });
+                    if (dataLines.length) {
+                        onEvent(event, JSON.parse(dataLines.join('\n')));
+                    }
+                }
+            }
+        }
+        
         addMessage(type, text) {
             const messages = document.getElementById('chat-messages');
             const messageDiv = document.createElement('div');
@@ -136,6 +218,13 @@
             messageDiv.innerHTML = `<div class="message-content">${this.escapeHtml(text)}</div>`;
             messages.appendChild(messageDiv);
             messages.scrollTop = messages.scrollHeight;
+            return messageDiv.querySelector('.message-content');
+        }
+        
+        updateMessage(contentElement, text) {
+            const messages = document.getElementById('chat-messages');
+            contentElement.textContent = text;
+            messages.scrollTop = messages.scrollHeight;
         }
         
         showTyping() {
@@ -0,0 +1,117 @@
+"""
+Бенчмарк бэкендов эмбеддингов: torch, onnx (fp32) и onnx-int8.
+
+Каждый бэкенд запускается в отдельном процессе, чтобы память одного (в том числе
+импорт torch) не влияла на другой. Измеряются время загрузки, RSS после загрузки и
+пиковый, задержка embed_query (p50/p95) и пропускная способность embed_documents.
+
+Запуск из корня проекта после python scripts/export_onnx_model.py --quantize:
+    python scripts/bench/bench_embedding_backends.py --queries 200 --chunks 512
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from app.core.config import settings
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+WORDS = (
+    "занятие группа стоимость расписание преподаватель курс обучение ученик "
+    "программа урок абонемент скидка школа английский математика подготовка "
+    "экзамен домашнее задание онлайн формат индивидуально родители ребенок"
+).split()
+
+def synthetic_texts(count: int, min_words: int, max_words: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    return [
+        " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(min_words, max_words))).capitalize() + "."
+        for _ in range(count)
+    ]
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run_backend(name: str, args) -> dict:
+    """Замеры одного бэкенда (выполняется в дочернем процессе)"""
+    from app.services.embedding_backends import OnnxEmbeddingBackend, TorchEmbeddingBackend, default_onnx_dir
+
+    start = time.perf_counter()
+    if name == "torch":
+        backend = TorchEmbeddingBackend(MODEL_NAME, args.batch_size)
+    else:
+        backend = OnnxEmbeddingBackend(
+            args.model_dir or default_onnx_dir(MODEL_NAME), MODEL_NAME, args.batch_size,
+            settings.embedding_max_seq_length, quantized=name == "onnx-int8", threads=args.threads
+        )
+    backend.embed_query("прогрев модели")
+    load_seconds = time.perf_counter() - start
+    rss_loaded = current_rss_mb()
+
+    latencies = []
+    for query in synthetic_texts(args.queries, 3, 10, seed=1):
+        query_start = time.perf_counter()
+        backend.embed_query(query)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+
+    chunks = synthetic_texts(args.chunks, 40, 80, seed=2)
+    chunks_start = time.perf_counter()
+    backend.embed_documents(chunks)
+    throughput = len(chunks) / (time.perf_counter() - chunks_start)
+
+    return {
+        "backend": name,
+        "load_s": load_seconds,
+        "rss_mb": rss_loaded,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "chunks_per_s": throughput,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--queries", type=int, default=200, help="Запросов для замера задержки")
+    parser.add_argument("--chunks", type=int, default=512, help="Чанков для замера пропускной способности")
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_batch_size)
+    parser.add_argument("--threads", type=int, default=settings.embedding_onnx_threads)
+    parser.add_argument("--model-dir", default=settings.embedding_onnx_path)
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args)))
+        return
+
+    print(f"{'Бэкенд':<10} {'загрузка':>9} {'RSS':>9} {'пик RSS':>9} {'p50':>8} {'p95':>8} {'чанков/с':>9}")
+    for name in args.backends:
+        command = [sys.executable, __file__, "--worker", name, "--queries", str(args.queries),
+                   "--chunks", str(args.chunks), "--batch-size", str(args.batch_size), "--threads", str(args.threads)]
+        if args.model_dir:
+            command += ["--model-dir", args.model_dir]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "ошибка"
+            print(f"{name:<10} не удалось: {error}")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{name:<10} {result['load_s']:>8.1f}s {result['rss_mb']:>7.0f}МБ {result['peak_rss_mb']:>7.0f}МБ "
+              f"{result['p50_ms']:>6.1f}мс {result['p95_ms']:>6.1f}мс {result['chunks_per_s']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
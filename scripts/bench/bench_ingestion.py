@@ -0,0 +1,70 @@
+"""
+Бенчмарк эмбеддинга при загрузке документа: по одному чанку против батчей.
+
+Запуск из корня проекта (Qdrant не нужен):
+    python scripts/bench/bench_ingestion.py --pages 300 --batch-size 64
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from app.core.config import settings
+from app.utils.chunking import build_text_splitter, load_tokenizer
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+WORDS = (
+    "занятие группа стоимость расписание преподаватель курс обучение ученик "
+    "программа урок абонемент скидка школа английский математика подготовка "
+    "экзамен домашнее задание онлайн формат индивидуально родители ребенок"
+).split()
+
+def synthetic_document(pages: int, seed: int = 42) -> str:
+    """Синтетический текст ~1800 символов на страницу"""
+    rnd = random.Random(seed)
+    paragraphs = []
+    for _ in range(pages * 4):
+        sentences = []
+        for _ in range(rnd.randint(3, 6)):
+            words = [rnd.choice(WORDS) for _ in range(rnd.randint(6, 14))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+def measure(label: str, func, chunks: list) -> float:
+    start = time.perf_counter()
+    func(chunks)
+    elapsed = time.perf_counter() - start
+    rate = len(chunks) / elapsed
+    print(f"{label:<28} {elapsed:8.2f} s  {rate:8.1f} chunks/s")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_batch_size)
+    args = parser.parse_args()
+
+    splitter = build_text_splitter(
+        load_tokenizer(MODEL_NAME),
+        chunk_size=settings.chunk_size_tokens,
+        chunk_overlap=settings.chunk_overlap_tokens,
+        max_seq_length=settings.embedding_max_seq_length
+    )
+    chunks = splitter.split_text(synthetic_document(args.pages))
+    print(f"Синтетический документ: {args.pages} стр., {len(chunks)} чанков")
+
+    model = HuggingFaceEmbeddings(model_name=MODEL_NAME, encode_kwargs={"batch_size": args.batch_size})
+    model.embed_query("прогрев модели")
+
+    before = measure("до: embed_query по одному", lambda items: [model.embed_query(c) for c in items], chunks)
+    after = measure(f"после: embed_documents ({args.batch_size})", model.embed_documents, chunks)
+    print(f"Ускорение: x{after / before:.2f}")
+
+if __name__ == "__main__":
+    main()
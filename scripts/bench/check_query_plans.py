@@ -0,0 +1,145 @@
+"""
+Проверка планов горячих запросов: ни один не должен читать таблицу последовательным сканированием.
+
+Заполняет базу синтетическими данными внутри транзакции, выполняет ANALYZE
+и EXPLAIN (FORMAT JSON) для запросов чата, админки и outbox, затем откатывает транзакцию.
+Код выхода 1, если в плане любого запроса есть Seq Scan.
+
+Запуск из корня проекта на базе с примененными миграциями (alembic upgrade head):
+    python scripts/bench/check_query_plans.py --sessions 5000 --messages-per-session 20
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from sqlalchemy import create_engine, func, select, text, update
+from sqlalchemy.dialects import postgresql
+from app.core.config import settings
+from app.models.db_models import Contact, CrmOutbox, Document, Message, SessionSummary
+
+SESSION_ID = "session-42"
+CONTACT_ID = 42
+
+def hot_queries() -> dict:
+    """Запросы в том виде, в каком их выполняет приложение"""
+    return {
+        "история сессии": (
+            select(Message, Contact)
+            .outerjoin(Contact, Contact.id == Message.contact_id)
+            .where(Message.session_id == SESSION_ID, Message.id > 0)
+            .order_by(Message.id.desc())
+            .limit(settings.history_max_messages)
+        ),
+        "контакт сессии": (
+            select(Contact)
+            .join(Message, Message.contact_id == Contact.id)
+            .where(Message.session_id == SESSION_ID)
+            .limit(1)
+        ),
+        "привязка сообщений к контакту": (
+            update(Message)
+            .where(Message.session_id == SESSION_ID, Message.contact_id == None)
+            .values(contact_id=CONTACT_ID)
+        ),
+        "сверка состояния сессии": select(
+            select(func.max(Message.id)).where(Message.session_id == SESSION_ID).scalar_subquery(),
+            select(SessionSummary.last_message_id).where(SessionSummary.session_id == SESSION_ID).scalar_subquery()
+        ),
+        "контакт по телефону": select(Contact).where(Contact.phone == "+79990000042").limit(1),
+        "сообщения контакта": select(Message).where(Message.contact_id == CONTACT_ID).order_by(Message.created_at),
+        "последние сообщения": select(Message).order_by(Message.created_at.desc()).limit(100),
+        "список контактов": select(Contact).order_by(Contact.created_at.desc()).limit(100),
+        "список документов": select(Document).order_by(Document.created_at.desc()).limit(100),
+        "задачи outbox": (
+            select(CrmOutbox)
+            .where(CrmOutbox.status.in_(["pending", "processing"]), CrmOutbox.next_attempt_at <= func.now())
+            .order_by(CrmOutbox.id)
+            .limit(settings.crm_outbox_batch_size)
+        ),
+    }
+
+def seed(conn, sessions: int, per_session: int):
+    """Синтетические данные: каждая пятая сессия оставила контакт"""
+    params = {"sessions": sessions, "per_session": per_session}
+    conn.execute(text(
+        "INSERT INTO contacts (name, phone, created_at) "
+        "SELECT 'Контакт ' || g, '+7999' || lpad(g::text, 7, '0'), now() - g * interval '1 minute' "
+        "FROM generate_series(1, :sessions / 5) g"
+    ), params)
+    conn.execute(text(
+        "INSERT INTO messages (contact_id, session_id, message, response, created_at) "
+        "SELECT CASE WHEN s % 5 = 0 THEN s / 5 END, 'session-' || s, 'Вопрос ' || m, 'Ответ ' || m, "
+        "       now() - (s * :per_session + m) * interval '1 second' "
+        "FROM generate_series(1, :sessions) s, generate_series(1, :per_session) m"
+    ), params)
+    conn.execute(text(
+        "INSERT INTO documents (name, file_path, file_type, file_size, created_at) "
+        "SELECT 'doc' || g || '.pdf', '/uploads/doc' || g || '.pdf', 'pdf', 1024, now() - g * interval '1 hour' "
+        "FROM generate_series(1, 2000) g"
+    ))
+    conn.execute(text(
+        "INSERT INTO session_summaries (session_id, summary, last_message_id) "
+        "SELECT 'session-' || s, 'Резюме ' || s, 0 FROM generate_series(1, :sessions, 2) s"
+    ), params)
+    conn.execute(text(
+        "INSERT INTO crm_outbox (dedup_key, contact_id, session_id, status, attempts, next_attempt_at) "
+        "SELECT 'lead:check:' || g, g, 'session-' || g, CASE WHEN g % 50 = 0 THEN 'pending' ELSE 'done' END, 1, "
+        "       now() + (g % 7 - 3) * interval '1 minute' "
+        "FROM generate_series(1, :sessions / 5) g"
+    ), params)
+    for table in ("contacts", "messages", "documents", "session_summaries", "crm_outbox"):
+        conn.execute(text(f"ANALYZE {table}"))
+
+def seq_scans(plan: dict) -> list:
+    """Таблицы, которые план читает последовательным сканированием"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+def explain(conn, statement) -> dict:
+    sql = statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    raw = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    return (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--messages-per-session", type=int, default=20, help="Обменов репликами на сессию")
+    parser.add_argument("--verbose", action="store_true", help="Печатать планы целиком")
+    args = parser.parse_args()
+
+    url = settings.database_url.replace("postgresql+asyncpg://", "postgresql://")
+    engine = create_engine(url)
+    failures = []
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            seed(conn, args.sessions, args.messages_per_session)
+            print(f"Данные: {args.sessions} сессий x {args.messages_per_session} сообщений")
+            print(f"{'Запрос':<32} {'Узел':<20} Seq Scan")
+            for name, statement in hot_queries().items():
+                plan = explain(conn, statement)
+                scans = seq_scans(plan)
+                print(f"{name:<32} {plan['Node Type']:<20} {', '.join(scans) or '-'}")
+                if args.verbose:
+                    print(json.dumps(plan, ensure_ascii=False, indent=2))
+                if scans:
+                    failures.append(name)
+        finally:
+            # Синтетические данные не сохраняются
+            transaction.rollback()
+    engine.dispose()
+
+    if failures:
+        print(f"\nПоследовательное сканирование в запросах: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nВсе запросы используют индексы")
+
+if __name__ == "__main__":
+    main()
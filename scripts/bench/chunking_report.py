@@ -0,0 +1,106 @@
+"""
+Отчет о разбиении корпуса на чанки: прежнее (500 символов, перекрытие 100) против
+разбиения по токенам модели эмбеддингов (CHUNK_SIZE_TOKENS / CHUNK_OVERLAP_TOKENS).
+
+Показывает число чанков, чанки длиннее лимита модели (их хвост не попадает в эмбеддинг),
+потерянные токены и размер индекса: векторы (384 x float32) и текст в payload.
+
+Запуск из корня проекта (Qdrant не нужен), по умолчанию - загруженные документы:
+    python scripts/bench/chunking_report.py backend/uploads
+    python scripts/bench/chunking_report.py docs/ --chunk-size 100 --chunk-overlap 10
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.core.config import settings
+from app.utils.chunking import SPECIAL_TOKENS, build_text_splitter, load_tokenizer, token_length_function
+from app.utils.text_extraction import SUPPORTED_EXTENSIONS, extract_text
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+VECTOR_BYTES = 384 * 4
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "..", "..", "backend", "uploads")
+
+def corpus_files(paths: list) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files.append(path)
+    return [path for path in files if path.lower().endswith(SUPPORTED_EXTENSIONS)]
+
+def chunk_stats(chunks: list, token_length, model_limit: int) -> dict:
+    lengths = [token_length(chunk) for chunk in chunks]
+    return {
+        "chunks": len(chunks),
+        "truncated": sum(1 for length in lengths if length > model_limit),
+        "lost_tokens": sum(max(0, length - model_limit) for length in lengths),
+        "max_tokens": max(lengths, default=0),
+        "text_bytes": sum(len(chunk.encode("utf-8")) for chunk in chunks),
+    }
+
+def index_bytes(stats: dict) -> int:
+    return stats["chunks"] * VECTOR_BYTES + stats["text_bytes"]
+
+def change(before: float, after: float) -> str:
+    return f"{(after - before) / before * 100:+.1f}%" if before else "-"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_CORPUS], help="Файлы или каталоги (txt, pdf, doc, docx)")
+    parser.add_argument("--chunk-size", type=int, default=settings.chunk_size_tokens)
+    parser.add_argument("--chunk-overlap", type=int, default=settings.chunk_overlap_tokens)
+    parser.add_argument("--verbose", action="store_true", help="Строка на каждый файл")
+    args = parser.parse_args()
+
+    files = corpus_files(args.paths)
+    if not files:
+        print("Документы не найдены")
+        sys.exit(1)
+
+    tokenizer = load_tokenizer(MODEL_NAME)
+    token_length = token_length_function(tokenizer)
+    model_limit = settings.embedding_max_seq_length - SPECIAL_TOKENS
+    old_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100, length_function=len)
+    new_splitter = build_text_splitter(tokenizer, args.chunk_size, args.chunk_overlap, settings.embedding_max_seq_length)
+
+    keys = ("chunks", "truncated", "lost_tokens", "text_bytes")
+    totals = {"old": dict.fromkeys(keys, 0), "new": dict.fromkeys(keys, 0)}
+    max_tokens = {"old": 0, "new": 0}
+    for path in files:
+        text = extract_text(path, os.path.basename(path))
+        per_file = {
+            "old": chunk_stats(old_splitter.split_text(text), token_length, model_limit),
+            "new": chunk_stats(new_splitter.split_text(text), token_length, model_limit),
+        }
+        for variant, stats in per_file.items():
+            for key in keys:
+                totals[variant][key] += stats[key]
+            max_tokens[variant] = max(max_tokens[variant], stats["max_tokens"])
+        if args.verbose:
+            print(f"{os.path.basename(path):<48} чанков {per_file['old']['chunks']:>6} -> {per_file['new']['chunks']:<6} "
+                  f"обрезано {per_file['old']['truncated']:>5} -> {per_file['new']['truncated']}")
+
+    old, new = totals["old"], totals["new"]
+    print(f"\nДокументов: {len(files)}, лимит модели: {model_limit} токенов, "
+          f"новое разбиение: {args.chunk_size} / {args.chunk_overlap} токенов")
+    print(f"{'':<32} {'500/100 символов':>18} {'по токенам':>14} {'изменение':>10}")
+    rows = [
+        ("Чанков", old["chunks"], new["chunks"]),
+        ("Обрезано моделью", old["truncated"], new["truncated"]),
+        ("Токенов не попало в эмбеддинг", old["lost_tokens"], new["lost_tokens"]),
+        ("Максимум токенов в чанке", max_tokens["old"], max_tokens["new"]),
+        ("Векторы, КБ", old["chunks"] * VECTOR_BYTES // 1024, new["chunks"] * VECTOR_BYTES // 1024),
+        ("Текст в payload, КБ", old["text_bytes"] // 1024, new["text_bytes"] // 1024),
+        ("Индекс всего, КБ", index_bytes(old) // 1024, index_bytes(new) // 1024),
+    ]
+    for label, before, after in rows:
+        print(f"{label:<32} {before:>18} {after:>14} {change(before, after):>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Проверка совпадения эмбеддингов ONNX-бэкенда (fp32 и int8) с torch (sentence-transformers).
+
+Для каждого текста считается косинусная близость векторов бэкендов, а для запросов -
+совпадение ближайшего фрагмента корпуса. Код выхода 1, если минимальная близость
+ниже порога (--min-cosine для fp32, --min-cosine-int8 для int8).
+
+Запуск из корня проекта после python scripts/export_onnx_model.py --quantize:
+    python scripts/bench/embedding_parity.py
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import numpy as np
+from app.core.config import settings
+from app.services.embedding_backends import (
+    ONNX_INT8_MODEL_FILE, ONNX_MODEL_FILE, OnnxEmbeddingBackend, TorchEmbeddingBackend, default_onnx_dir
+)
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+CORPUS = [
+    "Занятия в группе проходят два раза в неделю по 90 минут.",
+    "Стоимость индивидуального урока - 2500 рублей, абонемент на 8 занятий со скидкой 10%.",
+    "Подготовка к ОГЭ и ЕГЭ по математике начинается в сентябре.",
+    "Первое пробное занятие бесплатное, запись по телефону или через сайт.",
+    "Преподаватели имеют педагогическое образование и опыт работы от пяти лет.",
+    "Онлайн-формат доступен для учеников из любого города.",
+    "Домашнее задание проверяется в личном кабинете в течение суток.",
+    "Родители получают отчет об успеваемости ребенка раз в месяц.",
+    "Курс английского языка для начинающих длится девять месяцев.",
+    "Возврат оплаты за пропущенные занятия возможен при болезни по справке.",
+    "Karena Zhou is the head of the English department.",
+    "The school is open Monday to Saturday from 9 am to 9 pm.",
+    "Адрес: Москва, ул. Ленина, д. 15, офис 204. Ёлочная ярмарка проходит во дворе.",
+    "Скидка 15% для второго ребенка из одной семьи действует на все курсы.",
+]
+QUERIES = [
+    "сколько стоит урок",
+    "есть ли бесплатное пробное занятие",
+    "кто руководит отделом английского",
+    "можно ли заниматься онлайн из другого города",
+    "когда начинается подготовка к экзаменам",
+    "скидка на второго ребенка",
+    "what are the opening hours",
+    "как вернуть деньги за пропуск",
+]
+
+def normalize(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+def compare(label: str, reference: dict, candidate: dict, min_cosine: float) -> bool:
+    texts = CORPUS + QUERIES
+    cosines = np.sum(reference["texts"] * candidate["texts"], axis=1)
+    top_reference = np.argmax(reference["queries"] @ reference["corpus"].T, axis=1)
+    top_candidate = np.argmax(candidate["queries"] @ candidate["corpus"].T, axis=1)
+    agreement = float(np.mean(top_reference == top_candidate))
+    worst = int(np.argmin(cosines))
+    ok = float(cosines.min()) >= min_cosine
+    print(f"{label:<10} cos min {cosines.min():.5f}  mean {cosines.mean():.5f}  "
+          f"top-1 совпадает {agreement * 100:5.1f}%  порог {min_cosine}  {'OK' if ok else 'FAIL'}")
+    if not ok:
+        print(f"           худший текст: {texts[worst]!r}")
+    return ok
+
+def encode(backend) -> dict:
+    texts = normalize(backend.embed_documents(CORPUS + QUERIES))
+    # Запросы кодируются как в поиске - по одному
+    queries = normalize([backend.embed_query(query) for query in QUERIES])
+    return {"texts": texts, "corpus": texts[:len(CORPUS)], "queries": queries}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=settings.embedding_onnx_path or default_onnx_dir(MODEL_NAME))
+    parser.add_argument("--min-cosine", type=float, default=0.999)
+    parser.add_argument("--min-cosine-int8", type=float, default=0.98)
+    args = parser.parse_args()
+
+    batch_size = settings.embedding_batch_size
+    reference = encode(TorchEmbeddingBackend(MODEL_NAME, batch_size))
+    variants = [("onnx", False, ONNX_MODEL_FILE, args.min_cosine), ("onnx-int8", True, ONNX_INT8_MODEL_FILE, args.min_cosine_int8)]
+
+    passed = True
+    checked = 0
+    for label, quantized, filename, min_cosine in variants:
+        if not os.path.exists(os.path.join(args.model_dir, filename)):
+            print(f"{label:<10} пропущен: нет {filename} в {args.model_dir}")
+            continue
+        backend = OnnxEmbeddingBackend(
+            args.model_dir, MODEL_NAME, batch_size, settings.embedding_max_seq_length, quantized=quantized
+        )
+        passed = compare(label, reference, encode(backend), min_cosine) and passed
+        checked += 1
+
+    if not checked:
+        print("Нет экспортированных моделей: python scripts/export_onnx_model.py --quantize")
+        sys.exit(1)
+    if not passed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
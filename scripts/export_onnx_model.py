@@ -0,0 +1,38 @@
+"""
+Экспорт модели эмбеддингов в ONNX для EMBEDDING_BACKEND=onnx.
+
+Нужен torch (только для экспорта) и onnxruntime. По умолчанию модель сохраняется
+в backend/models/<модель>; --quantize дополнительно создает model_int8.onnx
+(EMBEDDING_ONNX_QUANTIZED=true).
+
+Запуск из корня проекта:
+    python scripts/export_onnx_model.py --quantize
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app.services.embedding_backends import default_onnx_dir, export_onnx_model
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--output", help="Каталог модели (по умолчанию backend/models/<модель>)")
+    parser.add_argument("--quantize", action="store_true", help="Также сохранить веса int8")
+    parser.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+
+    output = args.output or default_onnx_dir(args.model)
+    export_onnx_model(args.model, output, quantize=args.quantize, opset=args.opset)
+    for name in sorted(os.listdir(output)):
+        if name.endswith(".onnx"):
+            size = os.path.getsize(os.path.join(output, name)) / 1024 / 1024
+            print(f"{name:<20} {size:8.1f} МБ")
+    print(f"Модель сохранена в {output}")
+
+if __name__ == "__main__":
+    main()
@@ -41,6 +41,7 @@ fi
 # Экспорт переменных окружения
 export $(cat .env | grep -v '^#' | xargs)
 
-# Запуск через gunicorn
+# Миграции БД и запуск через gunicorn
 cd backend
+alembic upgrade head
 gunicorn app.main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --reload
@@ -220,7 +220,7 @@ mkdir -p backend/uploads
 echo -e "${YELLOW}Инициализация базы данных...${NC}"
 cd backend
 export $(cat ../.env | grep -v '^#' | xargs)
-python3 -c "from app.db.database import engine; from app.models.db_models import Base; Base.metadata.create_all(bind=engine); print('База данных инициализирована')"
+alembic upgrade head && echo "База данных инициализирована"
 cd ..
 
 # Запуск Qdrant в фоне